@@ -1,24 +1,85 @@
 #!/usr/bin/env python3.10
 from __future__ import annotations
 
+import argparse
 import asyncio
+import atexit
 import base64
 import json
+import random
+import time
 import traceback
+import uuid
+from datetime import date
 from datetime import datetime
 from datetime import timedelta
 from typing import Any
+from typing import Literal
 from typing import Mapping
+from typing import NamedTuple
 
 import aioredis
 import elasticsearch
+from app.common import indices
 from app.common import logger
+from app.common import osu_direct
 from app.common import settings
+from app.common import suggestions
+from app.common.cache import SEARCH_GENERATION_KEY
+from app.common.content_hashes import get_beatmap_content_hash
+from app.common.content_hashes import get_beatmapset_content_hash
 from app.common.services import OsuAPIClient
+from app.common.services import OsuAPIRequestError
+from app.common.services import OsuAPIRequestPriority
+from app.models.beatmaps import Beatmapset
+from app.models.ranked_statuses import get_update_interval
 
 
 MAXIMUM_BACKOFF = 32
 
+# the maximum number of pages buffered between each stage of the pipeline
+PIPELINE_QUEUE_SIZE = 4
+
+SearchSection = Literal[
+    "any",
+    "ranked",
+    "qualified",
+    "loved",
+    "pending",
+    "wip",
+    "graveyard",
+]
+
+# a page of beatmapsets, and the cursor of the next page
+Page = tuple[list[dict[str, Any]], dict[str, Any] | None]
+
+# a page of beatmapsets, their bulk operations, and the cursor of the next page
+Batch = tuple[list[dict[str, Any]], list[dict[str, Any]], dict[str, Any] | None]
+
+# a sorted set of beatmapset ids, scored by the time they're next due a refresh
+REFRESH_SCHEDULE_KEY = "beatmapsets_refresh_schedule"
+REFRESH_BATCH_SIZE = 50
+REFRESH_MAX_SLEEP = 60
+REFRESH_RETRY_DELAY = 60
+
+# the search sections polled for changes by the delta crawl, and how often
+DELTA_SECTIONS = ("any", "qualified", "pending", "loved")
+DELTA_INTERVAL = 30
+
+# the sharded crawl splits the catalogue by the month each beatmapset was
+# created in, and leases the shards out to workers (each with their own
+# osu!api credentials); the shards are small, so workers stay evenly loaded
+SHARD_FIRST_MONTH = date(2007, 10, 1)
+SHARD_LEASE_TIME = 60
+SHARD_HEARTBEAT_INTERVAL = 20
+
+# the id of the sharded crawl in progress, shared by all of it's workers;
+# it's cleared once every shard is done, so the next crawl starts afresh
+SHARD_RUN_KEY = "crawler_shard_run"
+# a run is forgotten (along with it's done shards) if no shard of it
+# is completed for this long
+SHARD_RUN_EXPIRY = timedelta(days=7)
+
 
 def stringify_cursor(cursor: dict[str, Any]) -> str:
     return base64.b64encode(
@@ -29,66 +90,244 @@ def stringify_cursor(cursor: dict[str, Any]) -> str:
     ).decode()
 
 
-def should_reindex_existing_documents(
-    beatmapset: Mapping[str, Any],
-    last_updated: datetime,
-) -> bool:
-    if beatmapset["status"] in ("ranked", "approved"):
-        # it is not possible to update a ranked or approved beatmapset
+def parse_osu_api_time(value: str) -> datetime:
+    # NOTE: fromisoformat doesn't support the "Z" suffix until python 3.11
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def get_beatmapset_update_interval(beatmapset: Mapping[str, Any]) -> timedelta | None:
+    return get_update_interval(
+        beatmapset["status"],
+        last_updated=parse_osu_api_time(beatmapset["last_updated"]),
+    )
+
+
+def should_reindex_existing_documents(indexed_document: Mapping[str, Any]) -> bool:
+    # NOTE: the indexed status decides, since the new payload's status may be one
+    # which never updates (e.g. a qualified beatmapset which has since been ranked)
+    update_interval = get_beatmapset_update_interval(indexed_document["data"])
+    if update_interval is None:
         return False
 
-    match beatmapset["status"]:
-        case "loved":
-            # loved maps can *technically* be updated
-            update_interval = timedelta(days=1)
-        case "graveyard":
-            # TODO: scale this with time since last beatmap update
-            update_interval = timedelta(days=1)
-        case "qualified":
-            update_interval = timedelta(minutes=5)
-        case "pending":
-            update_interval = timedelta(minutes=10)
-        case "wip":
-            update_interval = timedelta(minutes=5)
-        case _:
-            raise Exception(f"Unknown beatmapset status: {beatmapset['status']}")
-
-    return last_updated <= (datetime.now() - update_interval)
-
-
-async def get_last_indexed_times(
-    beatmapset_ids: list[str],
-) -> dict[int, datetime | None]:
+    # documents whose payload was unchanged aren't rewritten, only re-checked
+    last_checked = datetime.fromisoformat(
+        indexed_document.get("checked_at", indexed_document["updated_at"]),
+    )
+    return last_checked <= (datetime.now() - update_interval)
+
+
+async def get_indexed_documents(
+    index: str,
+    ids: list[int],
+) -> dict[int, dict[str, Any] | None]:
+    """\
+    Fetch the metadata of indexed documents, along with the status
+    & last updated time of their payload.
+    """
+    if not ids:
+        return {}
+
     elastic_response = await elastic_client.mget(
-        index=settings.BEATMAPSETS_INDEX,
-        ids=beatmapset_ids,
+        index=index,
+        ids=[str(id) for id in ids],
+        source_includes=[
+            "created_at",
+            "updated_at",
+            "checked_at",
+            "content_hash",
+            "data.status",
+            "data.last_updated",
+        ],
     )
 
-    last_updates = {
-        int(hit["_id"]): datetime.fromisoformat(hit["_source"]["updated_at"])
-        if hit["found"]
-        else None
+    return {
+        int(hit["_id"]): hit["_source"] if hit["found"] else None
         for hit in elastic_response["docs"]
     }
-    return last_updates
 
 
-async def crawl_beatmapsets() -> None:
-    saved_cursor: bytes | None = await redis_client.get("beatmapsets_cursor")
-    if saved_cursor is not None:
-        cursor = json.loads(saved_cursor.decode())
+def make_index_operation(
+    index: str,
+    data: dict[str, Any],
+    content_hash: str,
+    indexed_document: dict[str, Any] | None,
+    crawl_time: datetime,
+    extra_fields: Mapping[str, Any] | None = None,
+) -> list[dict[str, Any]]:
+    if indexed_document is not None:
+        created_at = indexed_document["created_at"]
     else:
-        cursor = {}
+        created_at = crawl_time.isoformat()
+
+    return [
+        {
+            "index": {
+                "_index": index,
+                "_id": str(data["id"]),
+            },
+        },
+        {
+            "data": data,
+            "content_hash": content_hash,
+            "created_at": created_at,
+            "updated_at": crawl_time.isoformat(),
+            "checked_at": crawl_time.isoformat(),
+            **(extra_fields or {}),
+        },
+    ]
+
+
+def make_check_operation(
+    index: str,
+    id: int,
+    crawl_time: datetime,
+) -> list[dict[str, Any]]:
+    return [
+        {
+            "update": {
+                "_index": index,
+                "_id": str(id),
+            },
+        },
+        {"doc": {"checked_at": crawl_time.isoformat()}},
+    ]
+
+
+async def build_operations(
+    beatmapsets: list[dict[str, Any]],
+    check_update_intervals: bool = True,
+) -> list[dict[str, Any]]:
+    """\
+    Build the elasticsearch bulk operations to index a page of beatmapsets.
+
+    Unless `check_update_intervals` is disabled (for beatmapsets we already
+    know to be due for an update), existing beatmapsets are only considered
+    if their indexed status' update interval has passed since they were
+    last indexed.
+    """
+    crawl_time = datetime.now()
+    operations = []
+
+    indexed_beatmapsets = await get_indexed_documents(
+        index=settings.BEATMAPSETS_INDEX,
+        ids=[beatmapset["id"] for beatmapset in beatmapsets],
+    )
+
+    changed_beatmapsets = []
+
+    for beatmapset in beatmapsets:
+        # fetch last time this beatmapset was updated
+        indexed_beatmapset = indexed_beatmapsets[beatmapset["id"]]
+        if indexed_beatmapset is not None and check_update_intervals:
+            should_index_beatmapset = should_reindex_existing_documents(
+                indexed_beatmapset,
+            )
+        else:
+            should_index_beatmapset = True
 
+        if not should_index_beatmapset:
+            logger.info(
+                "Skipping indexing of beatmapset",
+                beatmapset_id=beatmapset["id"],
+            )
+            continue
+
+        content_hash = get_beatmapset_content_hash(beatmapset)
+        if (
+            indexed_beatmapset is not None
+            and indexed_beatmapset.get("content_hash") == content_hash
+        ):
+            logger.info(
+                "Skipping indexing of unchanged beatmapset",
+                beatmapset_id=beatmapset["id"],
+            )
+            # record the check, so it isn't due for another update interval
+            operations.extend(
+                make_check_operation(
+                    index=settings.BEATMAPSETS_INDEX,
+                    id=beatmapset["id"],
+                    crawl_time=crawl_time,
+                ),
+            )
+            continue
+
+        logger.info(
+            "Indexing beatmapset",
+            beatmapset_id=beatmapset["id"],
+        )
+
+        # add sets to sets index
+        operations.extend(
+            make_index_operation(
+                index=settings.BEATMAPSETS_INDEX,
+                data=beatmapset,
+                content_hash=content_hash,
+                indexed_document=indexed_beatmapset,
+                crawl_time=crawl_time,
+                # pre-render the set's osu!direct search result row & suggestions
+                extra_fields={
+                    "osu_direct": osu_direct.format_row(
+                        Beatmapset.from_osu_api(beatmapset),
+                    ),
+                    "osu_direct_row_format_version": osu_direct.ROW_FORMAT_VERSION,
+                    "suggest": suggestions.get_suggest_field(beatmapset),
+                    "suggest_format_version": suggestions.SUGGEST_FORMAT_VERSION,
+                },
+            ),
+        )
+        changed_beatmapsets.append(beatmapset)
+
+    # add (only the changed) maps to maps index
+    indexed_beatmaps = await get_indexed_documents(
+        index=settings.BEATMAPS_INDEX,
+        ids=[
+            beatmap["id"]
+            for beatmapset in changed_beatmapsets
+            for beatmap in beatmapset["beatmaps"]
+        ],
+    )
+
+    for beatmapset in changed_beatmapsets:
+        for beatmap in beatmapset["beatmaps"]:
+            indexed_beatmap = indexed_beatmaps[beatmap["id"]]
+
+            content_hash = get_beatmap_content_hash(beatmap)
+            if (
+                indexed_beatmap is not None
+                and indexed_beatmap.get("content_hash") == content_hash
+            ):
+                continue
+
+            operations.extend(
+                make_index_operation(
+                    index=settings.BEATMAPS_INDEX,
+                    data=beatmap,
+                    content_hash=content_hash,
+                    indexed_document=indexed_beatmap,
+                    crawl_time=crawl_time,
+                ),
+            )
+
+    return operations
+
+
+async def fetch_pages(
+    client: OsuAPIClient,
+    section: SearchSection,
+    query: str | None,
+    cursor: dict[str, Any],
+    pages: asyncio.Queue[Page | None],
+) -> None:
+    """Fetch pages of beatmapsets from the osu!api, along with their next cursor."""
     backoff_time = 1
 
     while cursor is not None:
         try:
-            osuapi_result = await osu_api_client.search(
-                query=None,
+            osuapi_result = await client.search(
+                query=query,
                 general=None,
                 mode=None,
-                section="any",
+                section=section,
                 include_nsfw=True,
                 genre=None,
                 language=None,
@@ -97,6 +336,7 @@ async def crawl_beatmapsets() -> None:
                 played=None,
                 sort="updated_asc",
                 cursor_string=stringify_cursor(cursor) if cursor else None,
+                priority=OsuAPIRequestPriority.CRAWLER,
             )
             if osuapi_result["error"] is not None:
                 raise Exception(
@@ -107,117 +347,606 @@ async def crawl_beatmapsets() -> None:
             logger.error("Stack trace: ", error=traceback.format_exc())
 
             if backoff_time < MAXIMUM_BACKOFF:
-                backoff_time **= 2
+                backoff_time *= 2
 
-            print(f"Backing off on beatmap crawling - sleeping for {backoff_time}")
+            logger.info(
+                "Backing off on beatmap crawling",
+                backoff_time=backoff_time,
+            )
             await asyncio.sleep(backoff_time)
             continue
         else:
             backoff_time = 1
 
-        crawl_time = datetime.now()
-        operations = []
+        cursor = osuapi_result["cursor"]
+        await pages.put((osuapi_result["beatmapsets"], cursor))
+
+    await pages.put(None)
+
+
+async def classify_pages(
+    pages: asyncio.Queue[Page | None],
+    batches: asyncio.Queue[Batch | None],
+) -> None:
+    """Determine which beatmapsets in each page need (re)indexing."""
+    while (page := await pages.get()) is not None:
+        beatmapsets, cursor = page
+        operations = await build_operations(beatmapsets)
+        await batches.put((beatmapsets, operations, cursor))
+
+    await batches.put(None)
+
+
+def log_bulk_errors(elastic_response: Mapping[str, Any]) -> None:
+    """Log & count the individual failures within a bulk response."""
+    if not elastic_response["errors"]:
+        return
+
+    failures = 0
+
+    for item in elastic_response["items"]:
+        for action, result in item.items():
+            if "error" in result:
+                failures += 1
+                logger.error(
+                    "Failed to write document",
+                    action=action,
+                    index=result["_index"],
+                    document_id=result["_id"],
+                    status=result["status"],
+                    error=result["error"],
+                )
+
+    logger.error(
+        "Bulk write partially failed",
+        failures=failures,
+        successes=len(elastic_response["items"]) - failures,
+    )
+
+
+async def write_operations(operations: list[dict[str, Any]]) -> None:
+    if operations:
+        elastic_response = await elastic_client.bulk(operations=operations)
+        log_bulk_errors(elastic_response)
+
+        # invalidate the api's cached search results, unless the only
+        # operations were records of unchanged beatmapsets being checked
+        if any("index" in operation for operation in operations):
+            await redis_client.incr(SEARCH_GENERATION_KEY)
+
+
+async def schedule_refreshes(beatmapsets: list[dict[str, Any]]) -> None:
+    """Schedule the next refresh of each beatmapset, based on it's status."""
+    current_time = time.time()
+
+    due_times: dict[int, float] = {}
+    never_due: list[int] = []
+
+    for beatmapset in beatmapsets:
+        update_interval = get_beatmapset_update_interval(beatmapset)
+        if update_interval is None:
+            never_due.append(beatmapset["id"])
+        else:
+            due_times[beatmapset["id"]] = current_time + update_interval.total_seconds()
+
+    if due_times:
+        await redis_client.zadd(REFRESH_SCHEDULE_KEY, due_times)
+
+    if never_due:
+        await redis_client.zrem(REFRESH_SCHEDULE_KEY, *never_due)
+
+
+async def index_batches(
+    cursor_key: str,
+    batches: asyncio.Queue[Batch | None],
+) -> None:
+    """Write each batch into elasticsearch, and checkpoint it's cursor."""
+    while (batch := await batches.get()) is not None:
+        beatmapsets, operations, cursor = batch
+
+        await write_operations(operations)
+        await schedule_refreshes(beatmapsets)
+
+        # only save the cursor once the page has been written, so
+        # we never skip past beatmapsets which weren't indexed
+        if cursor is not None:
+            await redis_client.set(cursor_key, json.dumps(cursor))
+
+
+async def crawl_beatmapsets(
+    client: OsuAPIClient | None = None,
+    section: SearchSection = "any",
+    query: str | None = None,
+    cursor_key: str = "beatmapsets_cursor",
+) -> None:
+    """\
+    Crawl a search section (by default, the entire catalogue) to it's end,
+    optionally narrowed by a search query.
+    """
+    if client is None:
+        client = osu_api_client
+
+    saved_cursor: bytes | None = await redis_client.get(cursor_key)
+    if saved_cursor is not None:
+        cursor = json.loads(saved_cursor.decode())
+    else:
+        cursor = {}
+
+    # the crawl is split into stages connected by bounded queues, so the next
+    # page is fetched from the osu!api while the previous one is being indexed
+    pages: asyncio.Queue[Page | None] = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    batches: asyncio.Queue[Batch | None] = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    stages = [
+        asyncio.create_task(fetch_pages(client, section, query, cursor, pages)),
+        asyncio.create_task(classify_pages(pages, batches)),
+        asyncio.create_task(index_batches(cursor_key, batches)),
+    ]
+
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        # if any stage fails, stop the others too
+        for stage in stages:
+            stage.cancel()
+
+    logger.info("Finished crawling beatmapsets", section=section, query=query)
+
+
+async def fetch_beatmapset(id: int) -> dict[str, Any] | None:
+    try:
+        return await osu_api_client.get_beatmapset(
+            id,
+            priority=OsuAPIRequestPriority.REFRESH,
+        )
+    except OsuAPIRequestError as exc:
+        if exc.status_code == 404:
+            return None
+        else:
+            raise
+
+
+async def refresh_next_due_beatmapsets() -> float:
+    """\
+    Refresh the next batch of due beatmapsets, if any are due.
+
+    Returns how long to sleep for before the next beatmapset is due.
+    """
+    due_ids = [
+        int(id)
+        for id in await redis_client.zrangebyscore(
+            REFRESH_SCHEDULE_KEY,
+            min="-inf",
+            max=time.time(),
+            start=0,
+            num=REFRESH_BATCH_SIZE,
+        )
+    ]
+
+    if not due_ids:
+        # sleep until the next beatmapset is due
+        next_due = await redis_client.zrange(
+            REFRESH_SCHEDULE_KEY,
+            0,
+            0,
+            withscores=True,
+        )
+        if next_due:
+            sleep_time = min(next_due[0][1] - time.time(), REFRESH_MAX_SLEEP)
+        else:
+            sleep_time = REFRESH_MAX_SLEEP
+
+        return max(sleep_time, 0)
+
+    results = await asyncio.gather(
+        *(fetch_beatmapset(id) for id in due_ids),
+        return_exceptions=True,
+    )
+
+    beatmapsets: list[dict[str, Any]] = []
+    deleted_ids: list[int] = []
+    failed_ids: list[int] = []
+
+    for id, result in zip(due_ids, results):
+        if isinstance(result, Exception):
+            logger.error(
+                "Failed to refresh beatmapset",
+                beatmapset_id=id,
+                error=result,
+            )
+            failed_ids.append(id)
+        elif result is None:
+            deleted_ids.append(id)
+        else:
+            beatmapsets.append(result)
 
-        last_indexed_times = await get_last_indexed_times(
-            beatmapset_ids=[
-                beatmapset["id"] for beatmapset in osuapi_result["beatmapsets"]
-            ],
+    operations = await build_operations(beatmapsets, check_update_intervals=False)
+    await write_operations(operations)
+    await schedule_refreshes(beatmapsets)
+
+    if deleted_ids:
+        await redis_client.zrem(REFRESH_SCHEDULE_KEY, *deleted_ids)
+
+    if failed_ids:
+        retry_time = time.time() + REFRESH_RETRY_DELAY
+        await redis_client.zadd(
+            REFRESH_SCHEDULE_KEY,
+            {id: retry_time for id in failed_ids},
         )
 
-        for beatmapset in osuapi_result["beatmapsets"]:
-            # fetch last time this beatmapset was updated
-            last_updated = last_indexed_times[beatmapset["id"]]
-            if last_updated is not None:
-                should_index_beatmapset = should_reindex_existing_documents(
-                    beatmapset=beatmapset,
-                    last_updated=last_updated,
-                )
-            else:
-                should_index_beatmapset = True
+    logger.info(
+        "Refreshed due beatmapsets",
+        refreshed=len(beatmapsets),
+        deleted=len(deleted_ids),
+        failed=len(failed_ids),
+    )
+    return 0
+
 
-            if not should_index_beatmapset:
-                logger.info(
-                    "Skipping indexing of beatmapset",
-                    beatmapset_id=beatmapset["id"],
+async def refresh_due_beatmapsets() -> None:
+    """\
+    Continuously refresh beatmapsets as they become due, according to the
+    refresh schedule (which is populated as beatmapsets are indexed).
+    """
+    backoff_time = 1
+
+    while True:
+        try:
+            sleep_time = await refresh_next_due_beatmapsets()
+        except Exception as exc:
+            # the batch is still due, so it will be retried
+            logger.error(
+                "Failed to refresh due beatmapsets",
+                error=exc,
+                stacktrace=traceback.format_exc(),
+            )
+
+            if backoff_time < MAXIMUM_BACKOFF:
+                backoff_time *= 2
+
+            logger.info(
+                "Backing off on beatmapset refreshes",
+                backoff_time=backoff_time,
+            )
+            await asyncio.sleep(backoff_time)
+            continue
+        else:
+            backoff_time = 1
+
+        await asyncio.sleep(sleep_time)
+
+
+def get_watermark_key(section: str) -> str:
+    return f"beatmapsets_watermark:{section}"
+
+
+async def crawl_section_delta(section: SearchSection) -> int:
+    """\
+    Index beatmapsets in a search section which have been updated since it's
+    watermark (the most recent last_updated time we've seen), and move it on.
+
+    Returns the number of updated beatmapsets found.
+    """
+    saved_watermark: bytes | None = await redis_client.get(get_watermark_key(section))
+    if saved_watermark is not None:
+        watermark = parse_osu_api_time(saved_watermark.decode())
+    else:
+        watermark = None
+
+    new_watermark: str | None = None
+    updated_count = 0
+    cursor = None
+
+    while True:
+        osuapi_result = await osu_api_client.search(
+            section=section,
+            include_nsfw=True,
+            sort="updated_desc",
+            cursor_string=stringify_cursor(cursor) if cursor else None,
+            priority=OsuAPIRequestPriority.REFRESH,
+        )
+        if osuapi_result["error"] is not None:
+            raise Exception(
+                "Error while crawling beatmapsets: " + osuapi_result["error"],
+            )
+
+        page = osuapi_result["beatmapsets"]
+        if new_watermark is None and page:
+            new_watermark = page[0]["last_updated"]
+
+        updated_beatmapsets = [
+            beatmapset
+            for beatmapset in page
+            if watermark is None
+            or parse_osu_api_time(beatmapset["last_updated"]) > watermark
+        ]
+
+        if updated_beatmapsets:
+            operations = await build_operations(
+                updated_beatmapsets,
+                check_update_intervals=False,
+            )
+            await write_operations(operations)
+            await schedule_refreshes(updated_beatmapsets)
+            updated_count += len(updated_beatmapsets)
+
+        # stop once we reach beatmapsets we've already seen. without a
+        # watermark, we only take the first page; the sweep does the rest
+        cursor = osuapi_result["cursor"]
+        if watermark is None or len(updated_beatmapsets) < len(page) or not cursor:
+            break
+
+    if new_watermark is not None:
+        await redis_client.set(get_watermark_key(section), new_watermark)
+
+    return updated_count
+
+
+async def crawl_deltas() -> None:
+    """Continuously poll each search section for updated beatmapsets."""
+    while True:
+        for section in DELTA_SECTIONS:
+            try:
+                updated_count = await crawl_section_delta(section)
+            except Exception as exc:
+                logger.error(
+                    "Failed to crawl section for updates",
+                    section=section,
+                    error=exc,
+                    stacktrace=traceback.format_exc(),
                 )
                 continue
 
             logger.info(
-                "Indexing beatmapset",
-                beatmapset_id=beatmapset["id"],
+                "Crawled section for updates",
+                section=section,
+                updated=updated_count,
             )
 
-            # add sets to sets index
-            operations.append(
-                {
-                    "create": {
-                        "_index": settings.BEATMAPSETS_INDEX,
-                        "_id": str(beatmapset["id"]),
-                    },
-                },
+        await asyncio.sleep(DELTA_INTERVAL)
+
+
+def get_osu_api_credentials() -> list[tuple[int, str]]:
+    """\
+    Get all configured osu!api client credentials, from OSU_API_CREDENTIALS
+    (formatted as `id:secret,id:secret`) or OSU_API_CLIENT_ID/SECRET.
+    """
+    if not settings.OSU_API_CREDENTIALS:
+        return [(settings.OSU_API_CLIENT_ID, settings.OSU_API_CLIENT_SECRET)]
+
+    credentials = []
+    for credential in settings.OSU_API_CREDENTIALS.split(","):
+        client_id, client_secret = credential.strip().split(":", maxsplit=1)
+        credentials.append((int(client_id), client_secret))
+
+    return credentials
+
+
+class Shard(NamedTuple):
+    name: str
+    query: str
+
+
+def get_shards() -> list[Shard]:
+    """\
+    Get the shards of the catalogue; one for each month since the first
+    beatmapset was created. The first & last are open-ended, so the last
+    also covers beatmapsets created during the crawl.
+    """
+    months = []
+    month = SHARD_FIRST_MONTH
+    while month <= date.today():
+        months.append(month)
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    shards = []
+    for i, month in enumerate(months):
+        conditions = []
+        if i > 0:
+            conditions.append(f"created>={month.isoformat()}")
+        if i < len(months) - 1:
+            conditions.append(f"created<{months[i + 1].isoformat()}")
+
+        shards.append(
+            Shard(name=month.strftime("%Y-%m"), query=" ".join(conditions)),
+        )
+
+    return shards
+
+
+def get_shards_done_key(run_id: str) -> str:
+    return f"crawler_shards_done:{run_id}"
+
+
+async def hold_lease(lease: aioredis.lock.Lock) -> None:
+    """Keep a lease alive until cancelled, raising if it's lost."""
+    while True:
+        await asyncio.sleep(SHARD_HEARTBEAT_INTERVAL)
+        await lease.reacquire()
+
+
+async def crawl_shard(client: OsuAPIClient, run_id: str, shard: Shard) -> bool:
+    """\
+    Crawl a shard of the catalogue, if no other worker holds it's lease.
+
+    Returns whether the shard was crawled.
+    """
+    lease = redis_client.lock(
+        f"crawler_shard_lease:{run_id}:{shard.name}",
+        timeout=SHARD_LEASE_TIME,
+    )
+    if not await lease.acquire(blocking=False):
+        return False
+
+    logger.info("Acquired shard lease", shard=shard.name)
+
+    cursor_key = f"beatmapsets_cursor:{run_id}:{shard.name}"
+
+    heartbeat = asyncio.create_task(hold_lease(lease))
+    crawl = asyncio.create_task(
+        crawl_beatmapsets(
+            client=client,
+            section="any",
+            query=shard.query,
+            cursor_key=cursor_key,
+        ),
+    )
+
+    try:
+        await asyncio.wait({heartbeat, crawl}, return_when=asyncio.FIRST_COMPLETED)
+
+        if crawl.done():
+            # raises if the crawl failed
+            crawl.result()
+
+            shards_done_key = get_shards_done_key(run_id)
+            await redis_client.sadd(shards_done_key, shard.name)
+            await redis_client.expire(shards_done_key, SHARD_RUN_EXPIRY)
+            await redis_client.expire(SHARD_RUN_KEY, SHARD_RUN_EXPIRY)
+            await redis_client.delete(cursor_key)
+        else:
+            # if we've lost the lease (e.g. we stalled for too long),
+            # another worker may have already taken over the shard
+            logger.error(
+                "Lost shard lease",
+                shard=shard.name,
+                error=heartbeat.exception(),
             )
-            operations.append(
-                {
-                    "data": beatmapset,
-                    "created_at": crawl_time.isoformat(),
-                    "updated_at": crawl_time.isoformat(),
-                },
+    finally:
+        heartbeat.cancel()
+        crawl.cancel()
+
+        try:
+            await lease.release()
+        except aioredis.exceptions.LockError:
+            pass
+
+    return True
+
+
+async def run_shard_worker(client: OsuAPIClient, run_id: str) -> None:
+    """Crawl shards of the catalogue until all of them are complete."""
+    shards = get_shards()
+
+    while True:
+        done_shards = {
+            shard_name.decode()
+            for shard_name in await redis_client.smembers(
+                get_shards_done_key(run_id),
             )
+        }
+        remaining_shards = [shard for shard in shards if shard.name not in done_shards]
+        if not remaining_shards:
+            return
 
-            # add maps to maps index
-            for beatmap in beatmapset["beatmaps"]:
-                operations.append(
-                    {
-                        "create": {
-                            "_index": settings.BEATMAPS_INDEX,
-                            "_id": str(beatmap["id"]),
-                        },
-                    },
-                )
-                operations.append(
-                    {
-                        "data": beatmap,
-                        "created_at": crawl_time.isoformat(),
-                        "updated_at": crawl_time.isoformat(),
-                    },
+        # spread workers out over the shards
+        random.shuffle(remaining_shards)
+
+        for shard in remaining_shards:
+            try:
+                if await crawl_shard(client, run_id, shard):
+                    break
+            except Exception as exc:
+                logger.error(
+                    "Failed to crawl shard",
+                    shard=shard.name,
+                    error=exc,
+                    stacktrace=traceback.format_exc(),
                 )
+                break
+        else:
+            # every remaining shard is being crawled by another worker;
+            # wait around in case any of them die
+            await asyncio.sleep(SHARD_LEASE_TIME)
+
+
+async def get_shard_run_id() -> str:
+    """Join the sharded crawl in progress, or start a new one."""
+    await redis_client.set(
+        SHARD_RUN_KEY,
+        uuid.uuid4().hex,
+        nx=True,
+        ex=SHARD_RUN_EXPIRY,
+    )
 
-        if operations:
-            await elastic_client.bulk(operations=operations)
+    run_id: bytes = await redis_client.get(SHARD_RUN_KEY)
+    return run_id.decode()
+
+
+async def finish_shard_run(run_id: str) -> None:
+    # NOTE: the run's done shards are left to expire, rather than deleted,
+    # as other workers of the run may still be checking them
+    current_run_id: bytes | None = await redis_client.get(SHARD_RUN_KEY)
+    if current_run_id is not None and current_run_id.decode() == run_id:
+        await redis_client.delete(SHARD_RUN_KEY)
 
-        cursor = osuapi_result["cursor"]
-        if cursor is None:
-            print("Finished crawling beatmapsets")
-            print(osuapi_result)
-            return
 
-        await redis_client.set("beatmapsets_cursor", json.dumps(cursor))
+async def crawl_sharded() -> None:
+    """\
+    Crawl the catalogue in shards, with a worker for each osu!api credential.
 
+    Other processes running the sharded crawl will cooperate through redis.
+    """
+    clients = [
+        OsuAPIClient(
+            client_id=client_id,
+            client_secret=client_secret,
+            request_interval=settings.OSU_API_REQUEST_INTERVAL,
+            max_requests_per_minute=settings.OSU_API_MAX_REQUESTS_PER_MINUTE,
+            redis_client=redis_client,
+        )
+        for client_id, client_secret in get_osu_api_credentials()
+    ]
+
+    run_id = await get_shard_run_id()
+    logger.info("Joined sharded crawl", run_id=run_id)
+
+    try:
+        await asyncio.gather(
+            *(run_shard_worker(client, run_id) for client in clients),
+        )
+    finally:
+        for client in clients:
+            await client.close()
+
+    await finish_shard_run(run_id)
 
-async def async_main() -> int:
+    logger.info("Finished crawling all shards")
+
+
+async def async_main(mode: str) -> int:
     global osu_api_client, elastic_client, redis_client
-    osu_api_client = OsuAPIClient(
-        client_id=settings.OSU_API_CLIENT_ID,
-        client_secret=settings.OSU_API_CLIENT_SECRET,
-        request_interval=settings.OSU_API_REQUEST_INTERVAL,
-        max_requests_per_minute=settings.OSU_API_MAX_REQUESTS_PER_MINUTE,
-    )
     elastic_client = elasticsearch.AsyncElasticsearch(
         f"http://{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}",
     )
 
     # create elasticsearch indices if they don't already exist
-    for index in (settings.BEATMAPS_INDEX, settings.BEATMAPSETS_INDEX):
-        if not await elastic_client.indices.exists(index=index):
-            await elastic_client.indices.create(index=index)
+    await indices.create_indices(elastic_client)
 
     redis_client = aioredis.Redis.from_url(
         f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}",
     )
     await redis_client.initialize()
 
+    # the rate limit is shared with the api through redis
+    osu_api_client = OsuAPIClient(
+        client_id=settings.OSU_API_CLIENT_ID,
+        client_secret=settings.OSU_API_CLIENT_SECRET,
+        request_interval=settings.OSU_API_REQUEST_INTERVAL,
+        max_requests_per_minute=settings.OSU_API_MAX_REQUESTS_PER_MINUTE,
+        redis_client=redis_client,
+    )
+
     try:
-        await crawl_beatmapsets()
+        match mode:
+            case "sweep":
+                await crawl_beatmapsets()
+            case "refresh":
+                await refresh_due_beatmapsets()
+            case "delta":
+                await crawl_deltas()
+            case "sharded":
+                await crawl_sharded()
     except (KeyboardInterrupt, EOFError):
         pass
 
@@ -227,6 +956,21 @@ async def async_main() -> int:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        default="sweep",
+        choices=("sweep", "refresh", "delta", "sharded"),
+        help=(
+            "sweep: crawl the entire catalogue once, from the saved cursor; "
+            "refresh: continuously refresh beatmapsets as they become due; "
+            "delta: continuously poll for newly updated beatmapsets; "
+            "sharded: crawl the catalogue in shards, shared between workers"
+        ),
+    )
+    args = parser.parse_args()
+
     logger.overwrite_exception_hook()
     atexit.register(logger.restore_exception_hook)
 
@@ -235,5 +979,5 @@ if __name__ == "__main__":
         log_level=settings.LOG_LEVEL,
     )
 
-    exit_code = asyncio.run(async_main())
+    exit_code = asyncio.run(async_main(args.mode))
     raise SystemExit(exit_code)
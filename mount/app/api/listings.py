@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+import traceback
+from typing import Any
+from typing import NamedTuple
+
+from app.api import responses
+from app.common import cache
+from app.common import logger
+from app.models.gamemodes import GameMode
+from app.models.ranked_statuses import OsuAPIRankedStatus
+from app.models.response_formats import ResponseFormat
+from app.usecases import beatmapsets
+from fastapi.responses import Response
+
+# the statuses osu!direct lists by default, when browsing without a query
+LISTING_STATUSES = (
+    OsuAPIRankedStatus.RANKED,
+    OsuAPIRankedStatus.LOVED,
+    OsuAPIRankedStatus.QUALIFIED,
+    OsuAPIRankedStatus.PENDING,
+)
+
+# the number of beatmapsets in each listing (the search endpoint's default amount)
+LISTING_SIZE = 100
+
+# how often to check whether the crawler has written since the last rebuild
+LISTING_POLL_INTERVAL = 5.0
+
+# rebuilds are spaced out while the crawler is writing many batches in a row,
+# and forced every so often in case it fails to bump the search generation
+LISTING_MIN_REBUILD_INTERVAL = 30.0
+LISTING_MAX_REBUILD_INTERVAL = 300.0
+
+
+class Listing(NamedTuple):
+    json: bytes
+    osu_direct: bytes
+
+
+# (status, mode) -> listing; only ever replaced as a whole
+_listings: dict[tuple[int, int], Listing] = {}
+
+_refresh_task: asyncio.Task | None = None
+
+
+def get_response(
+    status: int,
+    mode: int,
+    osu_direct: bool,
+) -> Response | None:
+    """\
+    Fetch the pre-rendered response for the first page of a query-less
+    search, if we have one.
+    """
+    listing = _listings.get((int(status), int(mode)))
+    if listing is None:
+        cache.CACHE_MISSES.labels("listings", "memory").inc()
+        return None
+
+    cache.CACHE_HITS.labels("listings", "memory").inc()
+    if osu_direct:
+        return responses.prerendered(listing.osu_direct, media_type="text/plain")
+
+    return responses.prerendered(listing.json)
+
+
+async def _build_listing(status: int, mode: int) -> Listing:
+    search_kwargs: dict[str, Any] = {
+        "query": None,
+        "mode": mode,
+        "status": status,
+        "amount": LISTING_SIZE,
+        "offset": 0,
+    }
+    search_results = await beatmapsets.search(
+        **search_kwargs,
+        format=ResponseFormat.FULL,
+    )
+    osu_direct_results = await beatmapsets.search(
+        **search_kwargs,
+        format=ResponseFormat.OSU_DIRECT,
+    )
+
+    return Listing(
+        json=responses.success(
+            search_results["beatmapsets"],
+            cursor=search_results["cursor"],
+        ).body,
+        osu_direct=responses.osu_direct(osu_direct_results["rows"]).body,
+    )
+
+
+async def rebuild_listings() -> None:
+    """\
+    Rebuild the listings of each status & mode from elasticsearch.
+
+    The new listings are swapped in at once, after all have been built;
+    any which fail to build keep being served from the previous set.
+    """
+    global _listings
+
+    listings = dict(_listings)
+
+    for status, mode in itertools.product(LISTING_STATUSES, GameMode):
+        try:
+            listings[(int(status), int(mode))] = await _build_listing(status, mode)
+        except Exception:
+            logger.error(
+                "Failed to build beatmapset listing",
+                status=status.name,
+                mode=mode.name,
+                stacktrace=traceback.format_exc(),
+            )
+
+    _listings = listings
+
+
+async def _refresh_listings() -> None:
+    built_generation = None
+    built_at = 0.0
+
+    while True:
+        generation = await cache.get_search_generation()
+        time_since_build = time.time() - built_at
+
+        if (
+            generation != built_generation
+            and time_since_build >= LISTING_MIN_REBUILD_INTERVAL
+        ) or time_since_build >= LISTING_MAX_REBUILD_INTERVAL:
+            await rebuild_listings()
+            built_generation = generation
+            built_at = time.time()
+
+        await asyncio.sleep(LISTING_POLL_INTERVAL)
+
+
+def start_refreshing() -> None:
+    """Keep the listings up to date with the crawler's writes in the background."""
+    global _refresh_task
+    _refresh_task = asyncio.create_task(_refresh_listings())
+
+
+async def stop_refreshing() -> None:
+    global _refresh_task
+
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+
+        _refresh_task = None
@@ -1,17 +1,22 @@
 from __future__ import annotations
 
 from typing import Any
-from typing import Mapping
+from typing import Awaitable
+from typing import Callable
 from typing import Sequence
 
 from fastapi import status
 from fastapi.responses import ORJSONResponse
 from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
 
 
-def success(data: Any) -> ORJSONResponse:
+def success(data: Any, **metadata: Any) -> ORJSONResponse:
     return ORJSONResponse(
-        content={"status": "success", "data": data},
+        content={"status": "success", "data": data, **metadata},
         status_code=status.HTTP_200_OK,
     )
 
@@ -26,37 +31,39 @@ def error(status_code: int, message: str) -> ORJSONResponse:
 # special cases
 
 
-def osu_direct(beatmapsets: Sequence[Mapping[str, Any]]) -> Response:
+def osu_direct(rows: Sequence[str]) -> Response:
     # special case - return binary data
-    resp_data = bytearray()
-    beatmapset_count = 0
-
-    for beatmapset_data in beatmapsets:
-        difficulties_string = ",".join(
-            [
-                (
-                    "[{difficulty_rating:.2f}⭐] {version} "
-                    "{{cs: {cs} / od: {accuracy} / ar: {ar} / hp: {drain}}}@{mode_int}"
-                ).format(**beatmap)
-                # TODO: sort beatmaps by difficulty?
-                for beatmap in beatmapset_data["beatmaps"]
-            ],
-        )
-        print(beatmapset_data)
-        beatmapset_string = (
-            "{id}.osz|{artist}|{title}|{creator}|"
-            # TODO: the 10.0 is beatmap rating, which we don't have yet.
-            # this is what creates the bar in osu!direct
-            # https://i.cmyui.xyz/mt693h9hjl6km4hCgw.png
-            "{ranked}|10.0|{last_updated}|{id}|"
-            "0|{video}|0|0|0|{difficulties_string}\n"  # 0s are threadid, has_story,
-            # filesize, filesize_novid.
-        ).format(**beatmapset_data, difficulties_string=difficulties_string)
-
-        resp_data.extend(beatmapset_string.encode())
-        beatmapset_count += 1
-
+    # NOTE: rows are pre-rendered by `app.common.osu_direct.format_row`
     return Response(
-        content=f"{beatmapset_count}\n".encode() + bytes(resp_data),
+        content=f"{len(rows)}\n{''.join(rows)}".encode(),
         media_type="text/plain",
     )
+
+
+def prerendered(body: bytes, media_type: str = "application/json") -> Response:
+    # special case - the body was rendered ahead of time (e.g. by one of the above)
+    return Response(content=body, media_type=media_type)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """\
+    A streaming response which always calls `on_close` once it's done.
+
+    Unlike a background task, this also runs if the client disconnects,
+    including before the content has begun to be iterated.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        on_close: Callable[[], Awaitable[None]],
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
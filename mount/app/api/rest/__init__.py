@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-import httpx
+import aioredis
+from app.api import listings
 from app.api.rest import v1
+from app.common import indices
 from app.common import services
 from app.common import settings
+from app.common.disk_cache import DiskCache
+from app.common.mirrors import MirrorPool
 from app.common.services import OsuAPIClient
 from elasticsearch import AsyncElasticsearch
 from fastapi.applications import FastAPI
@@ -39,22 +43,40 @@ def init_events(app: FastAPI) -> None:
         )
 
         # create elasticsearch indices if they don't already exist
-        for index in (settings.BEATMAPS_INDEX, settings.BEATMAPSETS_INDEX):
-            if not await services.elastic_client.indices.exists(index=index):
-                await services.elastic_client.indices.create(index=index)
+        await indices.create_indices(services.elastic_client)
+
+        services.redis_client = aioredis.Redis.from_url(
+            f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}",
+        )
+        await services.redis_client.initialize()
 
         services.osu_api_client = OsuAPIClient(
             client_id=settings.OSU_API_CLIENT_ID,
             client_secret=settings.OSU_API_CLIENT_SECRET,
             request_interval=settings.OSU_API_REQUEST_INTERVAL,
             max_requests_per_minute=settings.OSU_API_MAX_REQUESTS_PER_MINUTE,
+            redis_client=services.redis_client,
+        )
+
+        services.osz_mirrors = MirrorPool(settings.OSZ_MIRRORS.split(","))
+
+        services.osz_cache = DiskCache(
+            name="osz",
+            path=settings.OSZ_CACHE_PATH,
+            max_bytes=settings.MAX_DISK_USAGE_GB * 1024**3,
+            eviction_policy=settings.OSZ_CACHE_EVICTION_POLICY,
         )
 
-        services.http_client = httpx.AsyncClient()
+        listings.start_refreshing()
 
     @app.on_event("shutdown")
     async def on_shutdown() -> None:
+        await listings.stop_refreshing()
+
         await services.elastic_client.close()
+        await services.redis_client.close()
+        await services.osz_mirrors.close()
+        services.osz_cache.close()
 
         # TODO: logout accounts..? is that weird?
 
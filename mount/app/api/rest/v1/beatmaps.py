@@ -3,9 +3,14 @@ from __future__ import annotations
 from app.api import responses
 from app.usecases import beatmaps
 from fastapi import APIRouter
+from fastapi.param_functions import Path
+from pydantic import BaseModel
 
 router = APIRouter()
 
+# the maximum number of beatmaps which may be requested in a single batch
+MAX_BATCH_SIZE = 100
+
 
 # TODO: response_model
 
@@ -17,3 +22,39 @@ async def get_beatmap(beatmap_id: int):
         return responses.error(404, "Beatmap not found")
 
     return responses.success(beatmap)
+
+
+@router.get("/beatmaps/md5/{checksum}")
+async def get_beatmap_by_checksum(
+    checksum: str = Path(..., min_length=32, max_length=32),
+):
+    beatmap = await beatmaps.get_from_checksum(checksum.lower())
+    if beatmap is None:
+        return responses.error(404, "Beatmap not found")
+
+    return responses.success(beatmap)
+
+
+class BeatmapsBatchRequest(BaseModel):
+    ids: list[int] = []
+    checksums: list[str] = []
+
+
+@router.post("/beatmaps/batch")
+async def get_beatmaps_batch(request: BeatmapsBatchRequest):
+    if len(request.ids) + len(request.checksums) > MAX_BATCH_SIZE:
+        return responses.error(400, f"At most {MAX_BATCH_SIZE} beatmaps per batch")
+
+    if any(len(checksum) != 32 for checksum in request.checksums):
+        return responses.error(400, "Invalid checksum")
+
+    # results are returned in the same order as they were requested,
+    # with a null in place of any beatmaps which could not be found
+    return responses.success(
+        {
+            "ids": await beatmaps.get_many_from_ids(request.ids),
+            "checksums": await beatmaps.get_many_from_checksums(
+                [checksum.lower() for checksum in request.checksums],
+            ),
+        },
+    )
@@ -1,15 +1,29 @@
 from __future__ import annotations
 
+from datetime import datetime
+
+from app.api import listings
 from app.api import responses
 from app.models.gamemodes import GameMode
 from app.models.ranked_statuses import OsuAPIRankedStatus
+from app.models.response_formats import ResponseFormat
+from app.models.search_filters import SearchFilters
 from app.usecases import beatmapsets
 from fastapi import APIRouter
+from fastapi.param_functions import Header
 from fastapi.param_functions import Query
-from fastapi.responses import Response
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
 
 router = APIRouter()
 
+# deeper pages must be fetched by cursor, since elasticsearch
+# must collect & sort `offset + amount` hits to serve an offset
+MAX_SEARCH_OFFSET = 1000
+
+# the maximum number of beatmapsets which may be requested in a single batch
+MAX_BATCH_SIZE = 100
+
 
 # TODO: response_model
 
@@ -19,27 +33,117 @@ async def get_beatmapset_search(
     # TODO: are any of these default weird?
     query: str | None = None,
     amount: int = Query(100, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
     status: OsuAPIRankedStatus = OsuAPIRankedStatus.ALL,
     mode: GameMode = GameMode.ALL,
     osu_direct: bool = False,
+    compact: bool = False,
+    cursor: str | None = None,
+    min_stars: float | None = Query(None, ge=0),
+    max_stars: float | None = Query(None, ge=0),
+    min_bpm: float | None = Query(None, ge=0),
+    max_bpm: float | None = Query(None, ge=0),
+    min_length: int | None = Query(None, ge=0),
+    max_length: int | None = Query(None, ge=0),
+    min_ar: float | None = Query(None, ge=0, le=10),
+    max_ar: float | None = Query(None, ge=0, le=10),
+    min_od: float | None = Query(None, ge=0, le=10),
+    max_od: float | None = Query(None, ge=0, le=10),
+    min_cs: float | None = Query(None, ge=0, le=10),
+    max_cs: float | None = Query(None, ge=0, le=10),
+    ranked_after: datetime | None = None,
+    ranked_before: datetime | None = None,
 ):
-    search_results = await beatmapsets.search(
-        query=query,
-        mode=mode,
-        status=status,
-        amount=amount,
-        offset=offset,
+    filters = SearchFilters(
+        min_stars=min_stars,
+        max_stars=max_stars,
+        min_bpm=min_bpm,
+        max_bpm=max_bpm,
+        min_length=min_length,
+        max_length=max_length,
+        min_ar=min_ar,
+        max_ar=max_ar,
+        min_od=min_od,
+        max_od=max_od,
+        min_cs=min_cs,
+        max_cs=max_cs,
+        min_ranked_date=ranked_after,
+        max_ranked_date=ranked_before,
     )
+
+    # the first page of each status' listing is served from memory
+    if (
+        query is None
+        and amount == listings.LISTING_SIZE
+        and offset == 0
+        and status in listings.LISTING_STATUSES
+        and not compact
+        and cursor is None
+        and filters == SearchFilters()
+    ):
+        response = listings.get_response(status, mode, osu_direct)
+        if response is not None:
+            return response
+
     if osu_direct:
-        return responses.osu_direct(search_results)
+        format = ResponseFormat.OSU_DIRECT
+    elif compact:
+        format = ResponseFormat.COMPACT
+    else:
+        format = ResponseFormat.FULL
+
+    try:
+        search_results = await beatmapsets.search(
+            query=query,
+            mode=mode,
+            status=status,
+            amount=amount,
+            offset=offset,
+            cursor=cursor,
+            format=format,
+            filters=filters,
+        )
+    except ValueError:
+        return responses.error(400, "Invalid or expired cursor")
+
+    if osu_direct:
+        return responses.osu_direct(search_results["rows"])
+
+    return responses.success(
+        search_results["beatmapsets"],
+        cursor=search_results["cursor"],
+    )
+
 
-    return responses.success(search_results)
+@router.get("/beatmapsets/suggest")
+async def get_beatmapset_suggestions(
+    query: str = Query(..., min_length=1, max_length=100),
+    amount: int = Query(10, ge=1, le=25),
+):
+    suggestions = await beatmapsets.suggest(prefix=query, amount=amount)
+    return responses.success(suggestions)
+
+
+class BeatmapsetsBatchRequest(BaseModel):
+    ids: list[int]
+
+
+@router.post("/beatmapsets/batch")
+async def get_beatmapsets_batch(request: BeatmapsetsBatchRequest):
+    if len(request.ids) > MAX_BATCH_SIZE:
+        return responses.error(400, f"At most {MAX_BATCH_SIZE} beatmapsets per batch")
+
+    # results are returned in the same order as they were requested,
+    # with a null in place of any beatmapsets which could not be found
+    return responses.success(await beatmapsets.get_many_from_ids(request.ids))
 
 
 @router.get("/beatmapsets/{beatmapset_id}")
-async def get_beatmapset(beatmapset_id: int):
-    beatmapset = await beatmapsets.get_from_id(beatmapset_id)
+async def get_beatmapset(beatmapset_id: int, compact: bool = False):
+    beatmapset = await beatmapsets.get_from_id(
+        beatmapset_id,
+        format=ResponseFormat.COMPACT if compact else ResponseFormat.FULL,
+    )
     if beatmapset is None:
         return responses.error(404, "Beatmapset not found")
 
@@ -47,12 +151,40 @@ async def get_beatmapset(beatmapset_id: int):
 
 
 @router.get("/beatmapsets/{beatmapset_id}/osz2")
-async def get_beatmapset_osz2(beatmapset_id: int):
-    beatmapset_osz = await beatmapsets.get_osz2_from_id(beatmapset_id)
-    if beatmapset_osz is None:
+async def get_beatmapset_osz2(
+    beatmapset_id: int,
+    range: str | None = Header(None),
+    if_range: str | None = Header(None),
+):
+    filename = f"{beatmapset_id}.osz"
+
+    # NOTE: cached files are streamed from disk rather than read into memory
+    # (zero-copy where the asgi server supports the pathsend extension), and
+    # range & if-range requests are handled by the FileResponse itself.
+    if osz_path := await beatmapsets.get_cached_osz2_path(
+        beatmapset_id,
+    ) or await beatmapsets.wait_for_osz2_download(beatmapset_id):
+        return FileResponse(
+            osz_path,
+            media_type="application/octet-stream",
+            filename=filename,
+        )
+
+    osz_stream = await beatmapsets.stream_osz2_from_id(
+        beatmapset_id,
+        range=range,
+        if_range=if_range,
+    )
+    if osz_stream is None:
         return responses.error(404, "Beatmapset not found")
 
-    return Response(
-        content=beatmapset_osz,
-        headers={"Content-Disposition": f'attachment; filename="{beatmapset_id}.osz"'},
+    return responses.ClosingStreamingResponse(
+        osz_stream.content,
+        status_code=osz_stream.status_code,
+        headers={
+            **osz_stream.headers,
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        },
+        media_type="application/octet-stream",
+        on_close=osz_stream.close,
     )
@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import fields
+from dataclasses import is_dataclass
+from datetime import timedelta
+from typing import Any
+from typing import Callable
+from typing import Hashable
+
+import aioredis
+import orjson
+from app.common import logger
+from app.common import services
+from app.common import settings
+from app.models.ranked_statuses import get_update_interval
+from prometheus_client import Counter
+from prometheus_client import Gauge
+
+CACHE_HITS = Counter(
+    "mirror_cache_hits_total",
+    "Number of cache lookups which were served from the cache.",
+    ["cache", "tier"],
+)
+CACHE_MISSES = Counter(
+    "mirror_cache_misses_total",
+    "Number of cache lookups which were not found in the cache.",
+    ["cache", "tier"],
+)
+CACHE_EVICTIONS = Counter(
+    "mirror_cache_evictions_total",
+    "Number of entries evicted from each cache to stay within budget.",
+    ["cache", "tier"],
+)
+CACHE_MEMORY_BYTES = Gauge(
+    "mirror_cache_memory_bytes",
+    "Approximate number of bytes held by each in-memory cache.",
+    ["cache"],
+)
+
+
+# bumped by the crawler after each write, invalidating cached search results
+SEARCH_GENERATION_KEY = "mirror:search_generation"
+
+# how often each worker re-reads the search generation from redis
+SEARCH_GENERATION_REFRESH_INTERVAL = 1.0
+
+
+# tiered caches measure the real size of one in this many of their entries, and
+# estimate the rest from the length of their serialized form
+SIZE_SAMPLE_INTERVAL = 100
+
+
+def get_size(value: Any) -> int:
+    """\
+    Approximate the number of bytes of memory held by a value,
+    including the objects within it's containers (& dataclasses).
+
+    Objects shared between values (e.g. interned strings) are counted
+    each time they're referenced, so this errs on the side of caution.
+    """
+    size = 0
+    objects = [value]
+
+    while objects:
+        obj = objects.pop()
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            objects.extend(obj.keys())
+            objects.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            objects.extend(obj)
+        elif is_dataclass(obj):
+            objects.extend(getattr(obj, field.name) for field in fields(obj))
+
+    return size
+
+
+class LRUCache:
+    """\
+    An in-memory least-recently-used cache bounded by a byte budget.
+
+    The size of each entry is measured from the objects it holds in memory,
+    which is several times larger than it's serialized form.
+    """
+
+    def __init__(self, name: str, max_bytes: int) -> None:
+        self.name = name
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+
+        # key -> (value, size, expires_at)
+        self._entries: OrderedDict[Hashable, tuple[Any, int, float | None]]
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, _, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float | None = None,
+        size: int | None = None,
+    ) -> None:
+        """\
+        Cache a value, evicting the least recently used entries to make room.
+
+        Entries are measured with `get_size`, unless an estimate of their
+        `size` is given (as measuring large values is relatively slow).
+        """
+        if size is None:
+            size = get_size(key) + get_size(value)
+
+        if size > self.max_bytes:
+            # this would evict everything else; don't bother caching it
+            return
+
+        self.delete(key)
+
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._entries[key] = (value, size, expires_at)
+        self.current_bytes += size
+
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            CACHE_EVICTIONS.labels(self.name, "memory").inc()
+
+        CACHE_MEMORY_BYTES.labels(self.name).set(self.current_bytes)
+
+    def delete(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+            CACHE_MEMORY_BYTES.labels(self.name).set(self.current_bytes)
+
+
+# shared between all tiered caches, so the whole process stays within budget;
+# the budget is split between the api's worker processes, as each has it's own
+memory_cache = LRUCache(
+    "shared",
+    max_bytes=settings.MAX_RAM_USAGE_GB * 1024**3 // settings.API_WORKERS,
+)
+
+
+class TieredCache:
+    """\
+    A two-tier cache; an in-process LRU in front of redis.
+
+    The in-process tier is private to each api worker, while the
+    redis tier is shared between all of them.
+
+    Values are stored in redis as json; a `decode` function may be given
+    to convert them back (e.g. into models) when they're read from redis.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        decode: Callable[[Any], Any] | None = None,
+    ) -> None:
+        self.name = name
+        self.decode = decode
+
+        # the ratio of an entry's size in memory to it's serialized length
+        self._size_ratio = 1.0
+        self._entries_since_measured: int | None = None
+
+    def _estimate_size(self, value: Any, serialized: bytes) -> int:
+        # measure an entry every so often, as most have a similar structure
+        if (
+            self._entries_since_measured is None
+            or self._entries_since_measured >= SIZE_SAMPLE_INTERVAL
+        ):
+            self._size_ratio = get_size(value) / max(len(serialized), 1)
+            self._entries_since_measured = 0
+
+        self._entries_since_measured += 1
+        return int(len(serialized) * self._size_ratio)
+
+    def _redis_key(self, key: Hashable) -> str:
+        return f"mirror:{self.name}:{key}"
+
+    async def get(self, key: Hashable) -> Any | None:
+        value = memory_cache.get((self.name, key))
+        if value is not None:
+            CACHE_HITS.labels(self.name, "memory").inc()
+            return value
+
+        CACHE_MISSES.labels(self.name, "memory").inc()
+
+        try:
+            serialized = await services.redis_client.get(self._redis_key(key))
+        except aioredis.RedisError:
+            logger.warning("Failed to read from redis cache", cache=self.name, key=key)
+            return None
+
+        if serialized is None:
+            CACHE_MISSES.labels(self.name, "redis").inc()
+            return None
+
+        CACHE_HITS.labels(self.name, "redis").inc()
+
+        # promote the entry into the in-memory tier, for the remainder of its ttl
+        ttl = await services.redis_client.ttl(self._redis_key(key))
+        value = orjson.loads(serialized)
+        if self.decode is not None:
+            value = self.decode(value)
+
+        memory_cache.set(
+            (self.name, key),
+            value,
+            ttl=ttl if ttl > 0 else None,
+            size=self._estimate_size(value, serialized),
+        )
+        return value
+
+    async def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: timedelta | None = None,
+    ) -> None:
+        """Cache a value in both tiers; a `ttl` of `None` never expires."""
+        serialized = orjson.dumps(value)
+        ttl_seconds = ttl.total_seconds() if ttl is not None else None
+
+        memory_cache.set(
+            (self.name, key),
+            value,
+            ttl=ttl_seconds,
+            size=self._estimate_size(value, serialized),
+        )
+
+        try:
+            await services.redis_client.set(
+                self._redis_key(key),
+                serialized,
+                ex=int(ttl_seconds) if ttl_seconds is not None else None,
+            )
+        except aioredis.RedisError:
+            logger.warning("Failed to write to redis cache", cache=self.name, key=key)
+
+    async def delete(self, key: Hashable) -> None:
+        memory_cache.delete((self.name, key))
+
+        try:
+            await services.redis_client.delete(self._redis_key(key))
+        except aioredis.RedisError:
+            logger.warning(
+                "Failed to delete from redis cache",
+                cache=self.name,
+                key=key,
+            )
+
+
+def get_ttl(osuapi_data: dict[str, Any]) -> timedelta | None:
+    """\
+    Get how long a beatmap or beatmapset may be cached for, based on it's status.
+
+    Statuses which can never be updated (ranked & approved) are cached forever.
+    """
+    return get_update_interval(osuapi_data["status"])
+
+
+_search_generation = 0
+_search_generation_fetched_at = 0.0
+
+
+async def get_search_generation() -> int:
+    """\
+    Get the current generation of the search index.
+
+    The generation is only re-read from redis periodically,
+    so this is cheap enough to call on every search.
+    """
+    global _search_generation, _search_generation_fetched_at
+
+    if time.time() - _search_generation_fetched_at < SEARCH_GENERATION_REFRESH_INTERVAL:
+        return _search_generation
+
+    try:
+        generation = await services.redis_client.get(SEARCH_GENERATION_KEY)
+    except aioredis.RedisError:
+        logger.warning("Failed to read search generation from redis")
+        return _search_generation
+
+    _search_generation = int(generation) if generation is not None else 0
+    _search_generation_fetched_at = time.time()
+    return _search_generation
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Any
+from typing import Mapping
+
+import orjson
+from app.common import osu_direct
+from app.common import suggestions
+
+# fields which change too often to be worth rewriting documents for
+VOLATILE_BEATMAPSET_FIELDS = frozenset({"play_count", "favourite_count"})
+VOLATILE_BEATMAP_FIELDS = frozenset({"playcount", "passcount"})
+
+
+def get_content_hash(
+    data: Mapping[str, Any],
+    excluded_fields: frozenset[str] = frozenset(),
+) -> str:
+    """Hash an osu!api payload, ignoring the given fields."""
+    return hashlib.blake2b(
+        orjson.dumps(
+            {k: v for k, v in data.items() if k not in excluded_fields},
+            option=orjson.OPT_SORT_KEYS,
+        ),
+        digest_size=16,
+    ).hexdigest()
+
+
+def get_beatmap_content_hash(beatmap: Mapping[str, Any]) -> str:
+    return get_content_hash(beatmap, VOLATILE_BEATMAP_FIELDS)
+
+
+def get_beatmapset_content_hash(beatmapset: Mapping[str, Any]) -> str:
+    # a beatmapset's beatmaps are hashed individually, and the format versions
+    # of derived fields are included so that changes to them re-render them
+    return get_content_hash(
+        {
+            **beatmapset,
+            "osu_direct_row_format_version": osu_direct.ROW_FORMAT_VERSION,
+            "suggest_format_version": suggestions.SUGGEST_FORMAT_VERSION,
+            "beatmaps": sorted(
+                get_beatmap_content_hash(beatmap) for beatmap in beatmapset["beatmaps"]
+            ),
+        },
+        VOLATILE_BEATMAPSET_FIELDS,
+    )
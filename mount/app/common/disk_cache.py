@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from types import TracebackType
+from typing import BinaryIO
+from typing import Literal
+from typing import Type
+
+from app.common import logger
+from app.common.cache import CACHE_EVICTIONS
+from app.common.cache import CACHE_HITS
+from app.common.cache import CACHE_MISSES
+from prometheus_client import Gauge
+
+DISK_CACHE_BYTES = Gauge(
+    "mirror_disk_cache_bytes",
+    "Number of bytes held by the on-disk cache.",
+    ["cache"],
+)
+
+# seconds after which an incomplete write is considered abandoned
+TEMP_FILE_MAX_AGE = 60 * 60
+
+# seconds for which a file is protected from eviction after it's path is
+# handed out, so it can be opened (once open, it's safe from being unlinked)
+PIN_DURATION = 60
+
+EVICTION_ORDERS = {
+    "lru": "last_accessed_at ASC",
+    "lfu": "hits ASC, last_accessed_at ASC",
+}
+
+
+class DiskCache:
+    """\
+    A content-addressed, size-bounded on-disk file cache.
+
+    Files are stored under the sha256 digest of their contents, and an index
+    of key -> digest (alongside access statistics used for eviction) is kept
+    in an sqlite database beside them, so the cache survives restarts.
+
+    The index may be shared between multiple processes.
+
+    The blocking sqlite & file operations are run in threads, so they don't
+    stall the event loop; only the constructor & `close` run on the caller's.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        max_bytes: int,
+        eviction_policy: Literal["lru", "lfu"] = "lru",
+    ) -> None:
+        self.name = name
+        self.path = path
+        self.max_bytes = max_bytes
+        self.eviction_policy = eviction_policy
+
+        self._files_path = os.path.join(path, "files")
+        self._temp_path = os.path.join(path, "tmp")
+        os.makedirs(self._files_path, exist_ok=True)
+        os.makedirs(self._temp_path, exist_ok=True)
+
+        self._db = sqlite3.connect(
+            os.path.join(path, "index.db"),
+            isolation_level=None,  # autocommit
+            check_same_thread=False,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """\
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_accessed_at REAL NOT NULL,
+                pinned_until REAL NOT NULL DEFAULT 0
+            )
+            """,
+        )
+
+        # index databases created before entries could be pinned
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(entries)")}
+        if "pinned_until" not in columns:
+            self._db.execute(
+                "ALTER TABLE entries ADD COLUMN pinned_until REAL NOT NULL DEFAULT 0",
+            )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)",
+        )
+
+        # the connection is shared by the threads running our operations
+        self._db_lock = threading.Lock()
+
+        self._remove_abandoned_temp_files()
+
+        DISK_CACHE_BYTES.labels(self.name).set(self._get_total_size())
+
+    def _remove_abandoned_temp_files(self) -> None:
+        # other processes may be writing into the directory right now,
+        # so only remove files which haven't been touched in a while
+        for file_name in os.listdir(self._temp_path):
+            file_path = os.path.join(self._temp_path, file_name)
+            try:
+                if os.path.getmtime(file_path) < time.time() - TEMP_FILE_MAX_AGE:
+                    os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _get_file_path(self, digest: str) -> str:
+        return os.path.join(self._files_path, digest[:2], digest)
+
+    def _get_total_size(self) -> int:
+        (total_size,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM "
+            "(SELECT DISTINCT digest, size FROM entries)",
+        ).fetchone()
+        return total_size
+
+    async def get(self, key: str) -> str | None:
+        """\
+        Get the path of a cached file, recording the access.
+
+        The file is pinned for `PIN_DURATION` seconds, and must be opened
+        within that time to be sure it hasn't been evicted.
+        """
+        return await asyncio.to_thread(self._get, key)
+
+    def _get(self, key: str) -> str | None:
+        with self._db_lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key: str) -> str | None:
+        row = self._db.execute(
+            "SELECT digest FROM entries WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            CACHE_MISSES.labels(self.name, "disk").inc()
+            return None
+
+        file_path = self._get_file_path(row[0])
+        if not os.path.exists(file_path):
+            # the file was removed from underneath us
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            CACHE_MISSES.labels(self.name, "disk").inc()
+            return None
+
+        current_time = time.time()
+        self._db.execute(
+            "UPDATE entries SET hits = hits + 1, last_accessed_at = ?, "
+            "pinned_until = ? WHERE key = ?",
+            (current_time, current_time + PIN_DURATION, key),
+        )
+        CACHE_HITS.labels(self.name, "disk").inc()
+        return file_path
+
+    def writer(self, key: str) -> DiskCacheWriter:
+        """\
+        Begin writing a file into the cache.
+
+        The file only becomes visible once the writer has been committed;
+        it should be used as an async context manager.
+        """
+        return DiskCacheWriter(self, key)
+
+    def _insert(self, key: str, digest: str, size: int) -> None:
+        with self._db_lock:
+            current_time = time.time()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, digest, size, hits, created_at, last_accessed_at, "
+                "pinned_until) VALUES (?, ?, ?, 0, ?, ?, ?)",
+                (
+                    key,
+                    digest,
+                    size,
+                    current_time,
+                    current_time,
+                    # the path is handed to those waiting on the download
+                    current_time + PIN_DURATION,
+                ),
+            )
+            self._evict(keep_key=key)
+
+    async def evict(self) -> None:
+        """Evict entries until the cache is within it's size budget."""
+        await asyncio.to_thread(self._evict_with_lock)
+
+    def _evict_with_lock(self) -> None:
+        with self._db_lock:
+            self._evict()
+
+    def _evict(self, keep_key: str | None = None) -> None:
+        total_size = self._get_total_size()
+
+        while total_size > self.max_bytes:
+            # files which were recently handed out may be about to be opened
+            row = self._db.execute(
+                "SELECT key, digest, size FROM entries "
+                "WHERE key IS NOT ? AND pinned_until < ? "
+                f"ORDER BY {EVICTION_ORDERS[self.eviction_policy]} LIMIT 1",
+                (keep_key, time.time()),
+            ).fetchone()
+            if row is None:
+                break
+
+            key, digest, size = row
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+            # other keys may share this content
+            (references,) = self._db.execute(
+                "SELECT COUNT(*) FROM entries WHERE digest = ?",
+                (digest,),
+            ).fetchone()
+            if references == 0:
+                try:
+                    os.remove(self._get_file_path(digest))
+                except FileNotFoundError:
+                    pass
+
+                total_size -= size
+
+            CACHE_EVICTIONS.labels(self.name, "disk").inc()
+            logger.info("Evicted file from disk cache", cache=self.name, key=key)
+
+        DISK_CACHE_BYTES.labels(self.name).set(total_size)
+
+
+class DiskCacheWriter:
+    """\
+    Writes a file into a disk cache atomically; data is written into a
+    temporary file, which is renamed into place once it's complete.
+
+    When used as an async context manager, the file is committed on a
+    clean exit and discarded if an exception is raised.
+    """
+
+    def __init__(self, cache: DiskCache, key: str) -> None:
+        self.cache = cache
+        self.key = key
+        self.size = 0
+        self.file_path: str | None = None
+
+        self._temp_file_path: str | None = None
+        self._file: BinaryIO | None = None
+        self._hash = hashlib.sha256()
+
+    async def __aenter__(self) -> DiskCacheWriter:
+        await asyncio.to_thread(self._open)
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            await self.commit()
+        else:
+            await self.abort()
+
+    def _open(self) -> None:
+        fd, self._temp_file_path = tempfile.mkstemp(dir=self.cache._temp_path)
+        self._file = os.fdopen(fd, "wb")
+
+    async def write(self, data: bytes) -> None:
+        await asyncio.to_thread(self._write, data)
+        self.size += len(data)
+
+    def _write(self, data: bytes) -> None:
+        assert self._file is not None
+        self._file.write(data)
+        self._hash.update(data)
+
+    async def commit(self) -> str:
+        """Move the file into the cache, returning it's final path."""
+        self.file_path = await asyncio.to_thread(self._commit)
+        return self.file_path
+
+    def _commit(self) -> str:
+        assert self._file is not None and self._temp_file_path is not None
+        self._file.close()
+
+        digest = self._hash.hexdigest()
+        file_path = self.cache._get_file_path(digest)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(self._temp_file_path, file_path)
+
+        self.cache._insert(self.key, digest, self.size)
+        return file_path
+
+    async def abort(self) -> None:
+        await asyncio.to_thread(self._abort)
+
+    def _abort(self) -> None:
+        if self._file is None or self._temp_file_path is None:
+            return
+
+        self._file.close()
+
+        try:
+            os.remove(self._temp_file_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+from typing import Callable
+
+from app.common import logger
+from app.common import osu_direct
+from app.common import settings
+from app.common import suggestions
+from app.models.beatmaps import Beatmapset
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_scan
+
+# NOTE: bump this whenever the mappings below change, then
+# run `python -m app.migrate_indices` to reindex the data.
+MAPPINGS_VERSION = 3
+
+# the number of documents updated in each bulk request while backfilling
+BACKFILL_BATCH_SIZE = 500
+
+INDEX_SETTINGS: dict[str, Any] = {
+    # most of our documents are the (large) stored osu!api payloads
+    "codec": "best_compression",
+    "analysis": {
+        "analyzer": {
+            "tags": {
+                "type": "custom",
+                "tokenizer": "whitespace",
+                "filter": ["lowercase", "asciifolding"],
+            },
+            "suggest": {
+                "type": "custom",
+                "tokenizer": "standard",
+                "filter": ["lowercase", "asciifolding"],
+            },
+        },
+    },
+}
+
+# fields which aren't listed here are kept in _source, but are not indexed
+BEATMAP_PROPERTIES: dict[str, Any] = {
+    "id": {"type": "keyword"},
+    "beatmapset_id": {"type": "keyword"},
+    "checksum": {"type": "keyword"},
+    "mode": {"type": "keyword"},
+    "mode_int": {"type": "keyword"},
+    "status": {"type": "keyword"},
+    "ranked": {"type": "keyword"},
+    "version": {"type": "text"},
+    "difficulty_rating": {"type": "float"},
+    "bpm": {"type": "float"},
+    "total_length": {"type": "integer"},
+    "hit_length": {"type": "integer"},
+    "cs": {"type": "float"},
+    "drain": {"type": "float"},
+    "accuracy": {"type": "float"},
+    "ar": {"type": "float"},
+    "last_updated": {"type": "date"},
+}
+
+BEATMAPSET_PROPERTIES: dict[str, Any] = {
+    "id": {"type": "keyword"},
+    "user_id": {"type": "keyword"},
+    "status": {"type": "keyword"},
+    "ranked": {"type": "keyword"},
+    "artist": {"type": "text"},
+    "artist_unicode": {"type": "text", "analyzer": "cjk"},
+    "title": {"type": "text"},
+    "title_unicode": {"type": "text", "analyzer": "cjk"},
+    "creator": {"type": "text"},
+    "source": {"type": "text"},
+    "tags": {"type": "text", "analyzer": "tags"},
+    "bpm": {"type": "float"},
+    "nsfw": {"type": "boolean"},
+    "video": {"type": "boolean"},
+    "ranked_date": {"type": "date"},
+    "submitted_date": {"type": "date"},
+    "last_updated": {"type": "date"},
+    # nested, so that searches can require a single beatmap to match
+    # all of their beatmap-level conditions (e.g. both mode & status)
+    "beatmaps": {
+        "type": "nested",
+        "dynamic": False,
+        "properties": BEATMAP_PROPERTIES,
+    },
+}
+
+DOCUMENT_PROPERTIES: dict[str, Any] = {
+    "created_at": {"type": "date"},
+    "updated_at": {"type": "date"},
+}
+
+BEATMAPS_MAPPINGS: dict[str, Any] = {
+    "dynamic": False,
+    "properties": {
+        **DOCUMENT_PROPERTIES,
+        "data": {
+            "type": "object",
+            "dynamic": False,
+            "properties": BEATMAP_PROPERTIES,
+        },
+    },
+}
+
+BEATMAPSETS_MAPPINGS: dict[str, Any] = {
+    "dynamic": False,
+    "properties": {
+        **DOCUMENT_PROPERTIES,
+        # populated at index time by `app.common.suggestions.get_suggest_field`
+        "suggest": {"type": "completion", "analyzer": "suggest"},
+        "data": {
+            "type": "object",
+            "dynamic": False,
+            "properties": BEATMAPSET_PROPERTIES,
+        },
+    },
+}
+
+
+def get_index_mappings() -> dict[str, dict[str, Any]]:
+    """Get the mappings for each of our index aliases."""
+    return {
+        settings.BEATMAPS_INDEX: BEATMAPS_MAPPINGS,
+        settings.BEATMAPSETS_INDEX: BEATMAPSETS_MAPPINGS,
+    }
+
+
+def get_versioned_index_name(alias: str, version: int = MAPPINGS_VERSION) -> str:
+    return f"{alias}_v{version}"
+
+
+async def create_indices(elastic_client: AsyncElasticsearch) -> None:
+    """\
+    Create our index templates, and our indices if they don't already exist.
+
+    Each index is accessed through an alias (e.g. `beatmaps`), which points
+    at the concrete index of the current mappings version (e.g. `beatmaps_v1`).
+    """
+    for alias, mappings in get_index_mappings().items():
+        await elastic_client.indices.put_index_template(
+            name=alias,
+            index_patterns=[f"{alias}_v*"],
+            template={"settings": INDEX_SETTINGS, "mappings": mappings},
+            version=MAPPINGS_VERSION,
+        )
+
+        if not await elastic_client.indices.exists(index=alias):
+            await elastic_client.indices.create(
+                index=get_versioned_index_name(alias),
+                aliases={alias: {}},
+            )
+
+
+async def _get_aliased_indices(
+    elastic_client: AsyncElasticsearch,
+    alias: str,
+) -> list[str]:
+    if await elastic_client.indices.exists_alias(name=alias):
+        response = await elastic_client.indices.get_alias(name=alias)
+        return list(response.body.keys())
+    elif await elastic_client.indices.exists(index=alias):
+        # a concrete index created before we started using aliases
+        return [alias]
+    else:
+        return []
+
+
+async def migrate_indices(elastic_client: AsyncElasticsearch) -> None:
+    """\
+    Reindex our data into indices using the current mappings version,
+    and atomically swap the aliases over to them once complete.
+
+    NOTE: the crawler should be stopped while this is running, as writes
+    made to the old indices during the reindex will not be carried over.
+    """
+    await create_indices(elastic_client)
+
+    for alias in get_index_mappings():
+        new_index = get_versioned_index_name(alias)
+        old_indices = await _get_aliased_indices(elastic_client, alias)
+
+        if old_indices == [new_index]:
+            logger.info("Index is already up to date", alias=alias, index=new_index)
+            continue
+
+        if not await elastic_client.indices.exists(index=new_index):
+            await elastic_client.indices.create(index=new_index)
+
+        logger.info(
+            "Reindexing documents",
+            alias=alias,
+            source_indices=old_indices,
+            dest_index=new_index,
+        )
+
+        response = await elastic_client.reindex(
+            source={"index": old_indices},
+            dest={"index": new_index},
+            wait_for_completion=False,
+            refresh=True,
+        )
+
+        while True:
+            task = await elastic_client.tasks.get(task_id=response["task"])
+            if task["completed"]:
+                break
+
+            await asyncio.sleep(5)
+
+        if failures := task["response"]["failures"]:
+            raise Exception(f"Failed to reindex {alias}: {failures}")
+
+        # swap the alias over to the new index in a single atomic operation
+        actions: list[dict[str, Any]] = []
+        for old_index in old_indices:
+            if old_index == alias:
+                actions.append({"remove_index": {"index": old_index}})
+            else:
+                actions.append({"remove": {"index": old_index, "alias": alias}})
+
+        actions.append({"add": {"index": new_index, "alias": alias}})
+
+        await elastic_client.indices.update_aliases(actions=actions)
+
+        logger.info(
+            "Swapped alias to new index",
+            alias=alias,
+            index=new_index,
+            documents=task["response"]["created"],
+        )
+
+
+async def _bulk_update(
+    elastic_client: AsyncElasticsearch,
+    operations: list[dict[str, Any]],
+) -> None:
+    response = await elastic_client.bulk(operations=operations)
+    if response["errors"]:
+        failures = [
+            result["error"]
+            for item in response["items"]
+            for result in item.values()
+            if "error" in result
+        ]
+        raise Exception(f"Failed to backfill documents: {failures}")
+
+
+async def _backfill_batch(
+    elastic_client: AsyncElasticsearch,
+    ids: list[str],
+    updates: dict[str, Callable[[dict[str, Any]], Any]],
+) -> None:
+    elastic_response = await elastic_client.mget(
+        index=settings.BEATMAPSETS_INDEX,
+        ids=ids,
+        source_includes=["data"],
+    )
+
+    operations: list[dict[str, Any]] = []
+    for doc in elastic_response["docs"]:
+        if not doc["found"]:
+            continue
+
+        beatmapset_data = doc["_source"]["data"]
+        operations.append({"update": {"_index": doc["_index"], "_id": doc["_id"]}})
+        operations.append(
+            {
+                "doc": {
+                    field: build(beatmapset_data) for field, build in updates.items()
+                }
+            },
+        )
+
+    if operations:
+        await _bulk_update(elastic_client, operations)
+
+
+async def _backfill_versioned_fields(
+    elastic_client: AsyncElasticsearch,
+    version_field: str,
+    version: int,
+    updates: dict[str, Callable[[dict[str, Any]], Any]],
+) -> int:
+    """\
+    Rebuild fields derived from the stored payloads of beatmapset documents
+    which weren't built with the current format version, returning the
+    number of documents updated.
+
+    Only the versions of all documents are scanned; the payloads (which are
+    much larger) are fetched for the outdated documents alone.
+    """
+    updates = {**updates, version_field: lambda _: version}
+
+    outdated_ids: list[str] = []
+    backfilled = 0
+
+    async for hit in async_scan(
+        elastic_client,
+        index=settings.BEATMAPSETS_INDEX,
+        query={"query": {"match_all": {}}},
+        _source_includes=[version_field],
+    ):
+        if hit.get("_source", {}).get(version_field) != version:
+            outdated_ids.append(hit["_id"])
+
+        if len(outdated_ids) >= BACKFILL_BATCH_SIZE:
+            await _backfill_batch(elastic_client, outdated_ids, updates)
+            backfilled += len(outdated_ids)
+            outdated_ids = []
+
+    if outdated_ids:
+        await _backfill_batch(elastic_client, outdated_ids, updates)
+        backfilled += len(outdated_ids)
+
+    return backfilled
+
+
+async def backfill_osu_direct_rows(elastic_client: AsyncElasticsearch) -> None:
+    """\
+    Pre-render the osu!direct rows of beatmapset documents which were
+    indexed without one, or with an outdated row format.
+
+    The crawler never revisits beatmapsets which can't be updated (e.g.
+    ranked ones), so their rows would otherwise be rendered on every search.
+    """
+    backfilled = await _backfill_versioned_fields(
+        elastic_client,
+        version_field="osu_direct_row_format_version",
+        version=osu_direct.ROW_FORMAT_VERSION,
+        updates={
+            "osu_direct": lambda beatmapset_data: osu_direct.format_row(
+                Beatmapset.from_osu_api(beatmapset_data),
+            ),
+        },
+    )
+    logger.info("Backfilled beatmapset osu!direct rows", documents=backfilled)
+
+
+async def backfill_suggestions(elastic_client: AsyncElasticsearch) -> None:
+    """\
+    Build the completion suggester field of beatmapset documents which were
+    indexed without one, or with an outdated suggestion format.
+
+    The crawler never revisits beatmapsets which can't be updated (e.g.
+    ranked ones), so their suggestions would otherwise never be (re)built.
+    They're built from the payloads we've already stored, rather than
+    re-fetched from the osu!api.
+    """
+    backfilled = await _backfill_versioned_fields(
+        elastic_client,
+        version_field="suggest_format_version",
+        version=suggestions.SUGGEST_FORMAT_VERSION,
+        updates={"suggest": suggestions.get_suggest_field},
+    )
+    logger.info("Backfilled beatmapset suggestions", documents=backfilled)
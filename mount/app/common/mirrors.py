@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from enum import Enum
+from typing import AsyncIterator
+from typing import NamedTuple
+from typing import Sequence
+from urllib.parse import urlparse
+
+import httpx
+from app.common import logger
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+
+MIRROR_REQUESTS = Counter(
+    "mirror_upstream_requests_total",
+    "Number of .osz requests sent to each upstream mirror, by outcome.",
+    ["mirror", "outcome"],
+)
+MIRROR_LATENCY_SECONDS = Histogram(
+    "mirror_upstream_latency_seconds",
+    "Time taken for each upstream mirror to begin responding to .osz requests.",
+    ["mirror"],
+)
+MIRROR_HEDGES = Counter(
+    "mirror_upstream_hedges_total",
+    "Number of hedged .osz requests sent to each upstream mirror, while"
+    " a slower mirror had yet to respond.",
+    ["mirror"],
+)
+MIRROR_CIRCUIT_OPEN = Gauge(
+    "mirror_upstream_circuit_open",
+    "Whether each upstream mirror's circuit breaker is open (or half-open).",
+    ["mirror"],
+)
+
+# NOTE: the read timeout also applies between chunks of the streamed file
+MIRROR_REQUEST_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+# the number of recent response latencies each mirror's p95 is taken from
+LATENCY_WINDOW = 100
+# mirrors with fewer samples than this are assumed to respond in DEFAULT_LATENCY
+MIN_LATENCY_SAMPLES = 10
+DEFAULT_LATENCY = 1.0
+
+# how quickly a mirror's error rate responds to new outcomes
+ERROR_RATE_DECAY = 0.1
+# how heavily recent errors count against a mirror's score
+ERROR_RATE_PENALTY = 10
+
+# a second mirror is requested once the first has taken longer than it's p95
+MIN_HEDGE_DELAY = 0.1
+MAX_HEDGE_DELAY = 5.0
+MAX_IN_FLIGHT_ATTEMPTS = 2
+
+# consecutive failures before a mirror stops being called, and how long until
+# a single trial request is let through to check whether it has recovered
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_COOLDOWN = 30.0
+
+# responses caused by the client's own request (e.g. an unsatisfiable range),
+# which a healthy mirror sends; they're passed through rather than failed over
+CLIENT_ERROR_STATUS_CODES = (412, 416)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class Mirror:
+    """\
+    An upstream mirror which .osz files can be downloaded from.
+
+    Mirrors are scored by their recent latency & error rate, and their
+    circuit breaker opens after too many consecutive failures.
+    """
+
+    def __init__(self, url_template: str) -> None:
+        self.url_template = url_template
+        self.name = urlparse(url_template).hostname or url_template
+
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.error_rate = 0.0
+
+        self._consecutive_failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+
+        MIRROR_CIRCUIT_OPEN.labels(self.name).set(0)
+
+    def get_url(self, id: int) -> str:
+        return self.url_template.format(id=id)
+
+    def get_latency_p95(self) -> float:
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return DEFAULT_LATENCY
+
+        latencies = sorted(self._latencies)
+        return latencies[int(len(latencies) * 0.95)]
+
+    def get_score(self) -> float:
+        """Get the mirror's score; lower is better."""
+        return self.get_latency_p95() * (1 + ERROR_RATE_PENALTY * self.error_rate)
+
+    def get_hedge_delay(self) -> float:
+        return min(max(self.get_latency_p95(), MIN_HEDGE_DELAY), MAX_HEDGE_DELAY)
+
+    @property
+    def circuit_state(self) -> CircuitState:
+        if self._opened_at is None:
+            return CircuitState.CLOSED
+
+        if time.monotonic() - self._opened_at < CIRCUIT_BREAKER_COOLDOWN:
+            return CircuitState.OPEN
+
+        return CircuitState.HALF_OPEN
+
+    def is_available(self) -> bool:
+        match self.circuit_state:
+            case CircuitState.CLOSED:
+                return True
+            case CircuitState.HALF_OPEN:
+                return not self._trial_in_flight
+            case CircuitState.OPEN:
+                return False
+
+    def start_attempt(self) -> None:
+        if self.circuit_state is CircuitState.HALF_OPEN:
+            self._trial_in_flight = True
+
+    def finish_attempt(self) -> None:
+        self._trial_in_flight = False
+
+    def record_success(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self.error_rate *= 1 - ERROR_RATE_DECAY
+
+        if self._opened_at is not None:
+            logger.info("Closing circuit breaker of mirror", mirror=self.name)
+            MIRROR_CIRCUIT_OPEN.labels(self.name).set(0)
+
+        self._consecutive_failures = 0
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        self.error_rate = self.error_rate * (1 - ERROR_RATE_DECAY) + ERROR_RATE_DECAY
+        self._consecutive_failures += 1
+
+        # a failed trial re-opens the circuit for another cooldown
+        if (
+            self.circuit_state is CircuitState.HALF_OPEN
+            or self._consecutive_failures == CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        ):
+            logger.warning(
+                "Opening circuit breaker of mirror",
+                mirror=self.name,
+                consecutive_failures=self._consecutive_failures,
+            )
+            MIRROR_CIRCUIT_OPEN.labels(self.name).set(1)
+            self._opened_at = time.monotonic()
+
+
+class MirrorResponse(NamedTuple):
+    mirror: Mirror
+    response: httpx.Response
+
+    async def aiter_bytes(self) -> AsyncIterator[bytes]:
+        """\
+        Stream the response's content, recording a failure of the mirror
+        if it's cut short (e.g. by a read timeout between chunks).
+        """
+        try:
+            async for chunk in self.response.aiter_bytes():
+                yield chunk
+        except httpx.RequestError as exc:
+            self.mirror.record_failure()
+            logger.warning(
+                "Request error while streaming osz2 from mirror",
+                mirror=self.mirror.name,
+                url=str(self.response.url),
+                error=repr(exc),
+            )
+            raise
+
+
+class MirrorPool:
+    """\
+    Downloads .osz files from the best of several upstream mirrors.
+
+    Requests go to the healthiest available mirror first; if it takes
+    longer than it's p95 latency to respond, the next mirror is requested
+    as well (a hedged request), and whichever serves the file first wins.
+    Mirrors which fail (or don't have the file) are failed over from.
+    """
+
+    def __init__(self, url_templates: Sequence[str]) -> None:
+        self.mirrors = [Mirror(url_template) for url_template in url_templates]
+        self._http_client = httpx.AsyncClient(timeout=MIRROR_REQUEST_TIMEOUT)
+
+        # hold references to the tasks closing abandoned responses
+        self._close_tasks: set[asyncio.Task] = set()
+
+    async def close(self) -> None:
+        await self._http_client.aclose()
+
+    def get_candidates(self) -> list[Mirror]:
+        """Get the available mirrors, best first."""
+        # NOTE: sorting is stable, so ties are broken by the configured order
+        return sorted(
+            (mirror for mirror in self.mirrors if mirror.is_available()),
+            key=lambda mirror: mirror.get_score(),
+        )
+
+    async def send(
+        self,
+        id: int,
+        headers: dict[str, str] | None = None,
+    ) -> MirrorResponse | None:
+        """\
+        Begin streaming a beatmapset's .osz file from the best mirror.
+
+        Returns the (200 or 206) response of the first mirror to serve it,
+        or `None` if no mirror could. Errors caused by the request itself
+        (e.g. a 416 for an unsatisfiable range) are returned as they are,
+        since every mirror would respond the same. It's content should be
+        streamed with `MirrorResponse.aiter_bytes`, so that failures
+        mid-stream are scored.
+        """
+        candidates = self.get_candidates()
+        if not candidates:
+            logger.warning("No upstream mirrors are available", beatmapset_id=id)
+            return None
+
+        loop = asyncio.get_running_loop()
+        attempts: set[asyncio.Task[MirrorResponse | None]] = set()
+        hedge_at = 0.0
+
+        try:
+            while candidates or attempts:
+                if candidates and not attempts:
+                    # fail over to the next mirror
+                    mirror = candidates.pop(0)
+                    attempts.add(self._start_attempt(mirror, id, headers))
+                    hedge_at = loop.time() + mirror.get_hedge_delay()
+
+                timeout = None
+                if candidates and len(attempts) < MAX_IN_FLIGHT_ATTEMPTS:
+                    timeout = max(hedge_at - loop.time(), 0)
+
+                done, _ = await asyncio.wait(
+                    attempts,
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                if not done:
+                    # the mirror is slower than usual; race it against the next
+                    mirror = candidates.pop(0)
+                    MIRROR_HEDGES.labels(mirror.name).inc()
+                    attempts.add(self._start_attempt(mirror, id, headers))
+                    hedge_at = loop.time() + mirror.get_hedge_delay()
+                    continue
+
+                winner = next(
+                    (attempt for attempt in done if attempt.result() is not None),
+                    None,
+                )
+                if winner is not None:
+                    # the remaining attempts are abandoned below
+                    attempts.remove(winner)
+                    return winner.result()
+
+                attempts -= done
+
+            return None
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+                attempt.add_done_callback(self._close_abandoned_response)
+
+    def _start_attempt(
+        self,
+        mirror: Mirror,
+        id: int,
+        headers: dict[str, str] | None,
+    ) -> asyncio.Task[MirrorResponse | None]:
+        mirror.start_attempt()
+        attempt = asyncio.create_task(self._attempt(mirror, id, headers))
+
+        # NOTE: this also runs if the attempt is cancelled before it starts
+        attempt.add_done_callback(lambda _: mirror.finish_attempt())
+        return attempt
+
+    async def _attempt(
+        self,
+        mirror: Mirror,
+        id: int,
+        headers: dict[str, str] | None,
+    ) -> MirrorResponse | None:
+        request = self._http_client.build_request(
+            "GET",
+            mirror.get_url(id),
+            headers=headers,
+        )
+
+        start_time = time.perf_counter()
+        try:
+            response = await self._http_client.send(request, stream=True)
+        except httpx.RequestError as exc:
+            MIRROR_REQUESTS.labels(mirror.name, "error").inc()
+            mirror.record_failure()
+            logger.warning(
+                "Request error while downloading osz2 from mirror",
+                mirror=mirror.name,
+                beatmapset_id=id,
+                error=repr(exc),
+            )
+            return None
+        except asyncio.CancelledError:
+            # another mirror served the file first
+            MIRROR_REQUESTS.labels(mirror.name, "cancelled").inc()
+            raise
+
+        latency = time.perf_counter() - start_time
+        MIRROR_LATENCY_SECONDS.labels(mirror.name).observe(latency)
+
+        if response.status_code in (200, 206):
+            MIRROR_REQUESTS.labels(mirror.name, "success").inc()
+            mirror.record_success(latency)
+            return MirrorResponse(mirror, response)
+
+        if response.status_code in CLIENT_ERROR_STATUS_CODES:
+            # the mirror is healthy; the client's request can't be served
+            MIRROR_REQUESTS.labels(mirror.name, "client_error").inc()
+            mirror.record_success(latency)
+            return MirrorResponse(mirror, response)
+
+        await response.aclose()
+
+        if response.status_code == 404:
+            # the mirror is healthy; it just doesn't have this beatmapset
+            MIRROR_REQUESTS.labels(mirror.name, "not_found").inc()
+            mirror.record_success(latency)
+        else:
+            MIRROR_REQUESTS.labels(mirror.name, "error").inc()
+            mirror.record_failure()
+            logger.warning(
+                "Received unhandled status code while downloading osz2 from mirror",
+                mirror=mirror.name,
+                beatmapset_id=id,
+                status_code=response.status_code,
+            )
+
+        return None
+
+    def _close_abandoned_response(
+        self,
+        attempt: asyncio.Task[MirrorResponse | None],
+    ) -> None:
+        # an attempt may have completed before it could be cancelled
+        if attempt.cancelled() or attempt.exception() is not None:
+            return
+
+        mirror_response = attempt.result()
+        if mirror_response is not None:
+            task = asyncio.create_task(mirror_response.response.aclose())
+            self._close_tasks.add(task)
+            task.add_done_callback(self._close_tasks.discard)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from datetime import timedelta
+from typing import Hashable
+
+import aioredis
+from app.common import logger
+from app.common import services
+from app.common.cache import CACHE_HITS
+from app.common.cache import CACHE_MISSES
+from app.common.cache import memory_cache
+
+# how long a key is remembered as missing for
+NEGATIVE_CACHE_TTL = timedelta(hours=1)
+
+# the size of each bloom filter in redis; 2mb each, allowing ~500k keys
+# per ttl with a false positive rate of roughly 1 in 100,000
+BLOOM_FILTER_BITS = 2**24
+BLOOM_FILTER_HASHES = 7
+
+
+class NegativeCache:
+    """\
+    Remembers keys which are known not to exist upstream (e.g. deleted
+    beatmaps), so repeated lookups for them don't use our osu!api quota.
+
+    Keys are held individually in the in-memory tier, and within a bloom
+    filter in redis, so redis memory use is fixed however many keys are
+    added, at the cost of a small rate of false positives.
+
+    The bloom filters are rotated every `ttl`, so a key is remembered
+    for between one and two `ttl`s after it was last added.
+    """
+
+    def __init__(self, name: str, ttl: timedelta = NEGATIVE_CACHE_TTL) -> None:
+        self.name = name
+        self.ttl = ttl
+
+    def _get_bloom_filter_key(self, window: int) -> str:
+        return f"mirror:{self.name}:bloom:{window}"
+
+    def _get_current_window(self) -> int:
+        return int(time.time() // self.ttl.total_seconds())
+
+    def _get_bit_offsets(self, key: Hashable) -> list[int]:
+        # derive each of the hashes from a single digest (double hashing)
+        digest = hashlib.blake2b(str(key).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % BLOOM_FILTER_BITS for i in range(BLOOM_FILTER_HASHES)]
+
+    async def contains(self, key: Hashable) -> bool:
+        """Check whether a key is known to be missing upstream."""
+        if memory_cache.get((self.name, key)) is not None:
+            CACHE_HITS.labels(self.name, "memory").inc()
+            return True
+
+        CACHE_MISSES.labels(self.name, "memory").inc()
+
+        bit_offsets = self._get_bit_offsets(key)
+        current_window = self._get_current_window()
+        windows = (current_window, current_window - 1)
+
+        try:
+            pipeline = services.redis_client.pipeline(transaction=False)
+            for window in windows:
+                for bit_offset in bit_offsets:
+                    pipeline.getbit(self._get_bloom_filter_key(window), bit_offset)
+
+            bits = await pipeline.execute()
+        except aioredis.RedisError:
+            logger.warning("Failed to read from redis bloom filter", cache=self.name)
+            return False
+
+        for i in range(len(windows)):
+            window_bits = bits[i * BLOOM_FILTER_HASHES : (i + 1) * BLOOM_FILTER_HASHES]
+            if all(window_bits):
+                CACHE_HITS.labels(self.name, "redis").inc()
+                self._remember(key)
+                return True
+
+        CACHE_MISSES.labels(self.name, "redis").inc()
+        return False
+
+    def _remember(self, key: Hashable) -> None:
+        memory_cache.set((self.name, key), True, ttl=self.ttl.total_seconds())
+
+    async def add(self, key: Hashable) -> None:
+        """Remember that a key is missing upstream."""
+        self._remember(key)
+
+        bloom_filter_key = self._get_bloom_filter_key(self._get_current_window())
+
+        try:
+            pipeline = services.redis_client.pipeline(transaction=False)
+            for bit_offset in self._get_bit_offsets(key):
+                pipeline.setbit(bloom_filter_key, bit_offset, 1)
+
+            # kept while it's the current or previous window
+            pipeline.expire(bloom_filter_key, int(self.ttl.total_seconds() * 2))
+            await pipeline.execute()
+        except aioredis.RedisError:
+            logger.warning("Failed to write to redis bloom filter", cache=self.name)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from app.models.beatmaps import Beatmap
+from app.models.beatmaps import Beatmapset
+
+# NOTE: bump this whenever the row format below changes, then run
+# `python -m app.migrate_indices` to re-render the rows of existing documents
+# (the crawler only re-renders those of beatmapsets which can still update).
+ROW_FORMAT_VERSION = 1
+
+
+def format_difficulty(beatmap: Beatmap) -> str:
+    return (
+        f"[{beatmap.difficulty_rating:.2f}⭐] {beatmap.version} "
+        f"{{cs: {beatmap.cs} / od: {beatmap.accuracy} / "
+        f"ar: {beatmap.ar} / hp: {beatmap.drain}}}@{beatmap.mode_int}"
+    )
+
+
+def format_row(beatmapset: Beatmapset) -> str:
+    """\
+    Render a beatmapset as a line of an osu!direct search response.
+
+    Rows are rendered once, when the beatmapset is indexed, and stored
+    alongside it's document so searches only need to concatenate them.
+    """
+    difficulties = ",".join(
+        [
+            format_difficulty(beatmap)
+            for beatmap in sorted(
+                beatmapset.beatmaps,
+                key=lambda beatmap: beatmap.difficulty_rating,
+            )
+        ],
+    )
+
+    # TODO: the 10.0 is beatmap rating, which we don't have yet.
+    # this is what creates the bar in osu!direct
+    # https://i.cmyui.xyz/mt693h9hjl6km4hCgw.png
+    # the 0s are thread id, has story, filesize & filesize without video
+    return (
+        f"{beatmapset.id}.osz|{beatmapset.artist}|{beatmapset.title}|"
+        f"{beatmapset.creator}|{beatmapset.ranked}|10.0|"
+        f"{beatmapset.last_updated}|{beatmapset.id}|"
+        f"0|{beatmapset.video}|0|0|0|{difficulties}\n"
+    )
@@ -2,18 +2,31 @@ from __future__ import annotations
 
 import asyncio
 import time
+from collections import deque
+from enum import IntEnum
 from types import TracebackType
 from typing import Any
 from typing import Literal
 from typing import Sequence
 from typing import Type
+from typing import TYPE_CHECKING
 
+import aioredis
 import httpx
+from app.common import logger
 from elasticsearch import AsyncElasticsearch
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+
+if TYPE_CHECKING:
+    from app.common.disk_cache import DiskCache
+    from app.common.mirrors import MirrorPool
 
 elastic_client: AsyncElasticsearch
+redis_client: aioredis.Redis
+osz_cache: DiskCache
 osu_api_client: OsuAPIClient
-http_client: httpx.AsyncClient
+osz_mirrors: MirrorPool
 
 
 class OsuAPIRequestError(Exception):
@@ -23,29 +36,125 @@ class OsuAPIRequestError(Exception):
         self.status_code = status_code
 
 
+OSU_API_QUEUE_DEPTH = Gauge(
+    "mirror_osu_api_queue_depth",
+    "Number of requests waiting for an osu!api rate limit token.",
+    ["lane"],
+)
+OSU_API_WAIT_SECONDS = Histogram(
+    "mirror_osu_api_wait_seconds",
+    "Time requests spent waiting for an osu!api rate limit token.",
+    ["lane"],
+)
+
+
+# the maximum number of ids the osu!api accepts in a single `get_beatmaps` request
+OSU_API_MAX_BEATMAPS_PER_REQUEST = 50
+
+
+class OsuAPIRequestPriority(IntEnum):
+    # lower values are served first
+    INTERACTIVE = 0  # a user is waiting on the response
+    REFRESH = 1  # updating data we already have
+    CRAWLER = 2  # discovering new data
+
+
+# the fraction of a shared token bucket which requests of each priority must
+# leave for those of higher priorities (e.g. in other processes) to use
+OSU_API_PRIORITY_RESERVES = {
+    OsuAPIRequestPriority.INTERACTIVE: 0.0,
+    OsuAPIRequestPriority.REFRESH: 0.1,
+    OsuAPIRequestPriority.CRAWLER: 0.25,
+}
+
+# takes a token from a shared bucket if one is available (beyond the reserve),
+# returning 0, or otherwise the number of seconds until one will be
+# KEYS[1]: the bucket; ARGV: capacity, refill rate, reserve, request interval
+OSU_API_TAKE_TOKEN_SCRIPT = """\
+local now = redis.call("TIME")
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local request_interval = tonumber(ARGV[4])
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "refilled_at", "requested_at")
+local tokens = tonumber(bucket[1]) or capacity
+local refilled_at = tonumber(bucket[2]) or now
+local requested_at = tonumber(bucket[3]) or 0
+
+tokens = math.min(tokens + (now - refilled_at) * refill_rate, capacity)
+
+local delay = math.max(
+    (reserve + 1 - tokens) / refill_rate,
+    requested_at + request_interval - now
+)
+if delay <= 0 then
+    tokens = tokens - 1
+    requested_at = now
+    delay = 0
+end
+
+redis.call(
+    "HSET", KEYS[1], "tokens", tokens, "refilled_at", now, "requested_at", requested_at
+)
+redis.call("EXPIRE", KEYS[1], 3600)
+
+-- NOTE: numbers are truncated to integers when returned
+return tostring(delay)
+"""
+
+
 class OsuAPIClient:
+    """\
+    A client for the osu!api, which rate limits it's requests by priority.
+
+    When given a redis client, the rate limit is shared by all processes
+    using the same credentials (e.g. each api worker & the crawler), and
+    lower priority requests leave part of the bucket for higher priority
+    ones. Without redis (or while it's unavailable), each process limits
+    itself to the full rate, so the combined rate may exceed it.
+    """
+
     def __init__(
         self,
         client_id: int,
         client_secret: str,
         request_interval: float = 1.0,
         max_requests_per_minute: int = 60,
+        redis_client: aioredis.Redis | None = None,
     ) -> None:
         self.client_id = client_id
         self.client_secret = client_secret
+        self._redis_client = redis_client
 
+        # requests are spaced by at least the request interval, and
+        # rate limited by a token bucket which refills at the rate of
+        # max_requests_per_minute, holding up to a minute's worth of tokens
         self.request_interval_time = request_interval
         self._last_request_time = 0.0
 
         self.max_requests_per_minute = max_requests_per_minute
-        self._requests_this_minute = 0
-        self._minute_start_time = 0.0
+        self._tokens = float(max_requests_per_minute)
+        self._last_refill_time = time.monotonic()
+
+        # requests waiting for a token, per priority lane
+        self._lanes: dict[OsuAPIRequestPriority, deque[asyncio.Future[None]]] = {
+            priority: deque() for priority in OsuAPIRequestPriority
+        }
+        self._requests_pending = asyncio.Event()
+        self._scheduler_task: asyncio.Task | None = None
 
         # NOTE: we disable timeouts here, as we trust the osu!api to be reliable
         self._http_client = httpx.AsyncClient(timeout=None)
         self._auth_data = {"token": None, "timeout": 0}
+        self._auth_lock = asyncio.Lock()
 
     async def close(self) -> None:
+        if self._scheduler_task is not None:
+            self._scheduler_task.cancel()
+
         await self._http_client.aclose()
 
     async def __aenter__(self) -> OsuAPIClient:
@@ -80,6 +189,126 @@ class OsuAPIClient:
             "timeout": time.time() + response_data["expires_in"],
         }
 
+    def _refill_tokens(self) -> None:
+        current_time = time.monotonic()
+        refill_rate = self.max_requests_per_minute / 60
+        self._tokens = min(
+            self._tokens + (current_time - self._last_refill_time) * refill_rate,
+            float(self.max_requests_per_minute),
+        )
+        self._last_refill_time = current_time
+
+    def _take_local_token(self) -> float:
+        self._refill_tokens()
+
+        current_time = time.monotonic()
+        delay = max(
+            (1 - self._tokens) / (self.max_requests_per_minute / 60),
+            self._last_request_time + self.request_interval_time - current_time,
+        )
+        if delay > 0:
+            return delay
+
+        self._tokens -= 1
+        self._last_request_time = current_time
+        return 0.0
+
+    async def _take_token(self, priority: OsuAPIRequestPriority) -> float:
+        """\
+        Take a rate limit token for a request of the given priority,
+        returning 0, or otherwise the number of seconds until one will be free.
+        """
+        if self._redis_client is None:
+            return self._take_local_token()
+
+        try:
+            delay = await self._redis_client.eval(
+                OSU_API_TAKE_TOKEN_SCRIPT,
+                1,
+                f"mirror:osu_api_rate_limit:{self.client_id}",
+                self.max_requests_per_minute,
+                self.max_requests_per_minute / 60,
+                self.max_requests_per_minute * OSU_API_PRIORITY_RESERVES[priority],
+                self.request_interval_time,
+            )
+        except aioredis.RedisError:
+            logger.warning("Failed to take a shared osu!api rate limit token")
+            return self._take_local_token()
+
+        return float(delay)
+
+    def _get_next_priority(self) -> OsuAPIRequestPriority | None:
+        for priority, lane in self._lanes.items():
+            # skip requests which were cancelled while waiting
+            while lane and lane[0].done():
+                lane.popleft()
+                OSU_API_QUEUE_DEPTH.labels(priority.name.lower()).set(len(lane))
+
+            if lane:
+                return priority
+
+        return None
+
+    def _get_next_waiter(self) -> asyncio.Future[None] | None:
+        for priority, lane in self._lanes.items():
+            while lane:
+                waiter = lane.popleft()
+                OSU_API_QUEUE_DEPTH.labels(priority.name.lower()).set(len(lane))
+
+                # skip requests which were cancelled while waiting
+                if not waiter.done():
+                    return waiter
+
+        return None
+
+    async def _schedule_requests(self) -> None:
+        """Hand out rate limit tokens to waiting requests, by priority."""
+        while True:
+            await self._requests_pending.wait()
+
+            priority = self._get_next_priority()
+            if priority is None:
+                self._requests_pending.clear()
+                continue
+
+            delay = await self._take_token(priority)
+            if delay > 0:
+                # NOTE: we choose the waiter after sleeping, so
+                # higher priority requests arriving meanwhile go first
+                await asyncio.sleep(delay)
+                continue
+
+            # NOTE: this may be a higher priority request than the token was
+            # taken for, if one arrived meanwhile; never a lower priority one
+            waiter = self._get_next_waiter()
+            if waiter is not None:
+                waiter.set_result(None)
+
+    async def _acquire_token(self, priority: OsuAPIRequestPriority) -> None:
+        if self._scheduler_task is None:
+            self._scheduler_task = asyncio.create_task(self._schedule_requests())
+
+        lane_name = priority.name.lower()
+        lane = self._lanes[priority]
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane.append(waiter)
+        OSU_API_QUEUE_DEPTH.labels(lane_name).set(len(lane))
+        self._requests_pending.set()
+
+        enqueue_time = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in lane:
+                lane.remove(waiter)
+                OSU_API_QUEUE_DEPTH.labels(lane_name).set(len(lane))
+            raise
+
+        OSU_API_WAIT_SECONDS.labels(lane_name).observe(
+            time.monotonic() - enqueue_time,
+        )
+
     async def request(
         self,
         method: Literal[
@@ -95,26 +324,26 @@ class OsuAPIClient:
         url: str,
         params: dict[str, Any] | None = None,
         headers: dict[str, Any] | None = None,
+        priority: OsuAPIRequestPriority = OsuAPIRequestPriority.INTERACTIVE,
     ) -> Any:
         """Perform a request to the osu!api."""
-        time_since_last_minute_start = time.time() - self._minute_start_time
-        if time_since_last_minute_start > 60:
-            # minute is over - reset
-            self._minute_start_time = time.time()
-            self._requests_this_minute = 0
-        else:
-            # validate per/min request count
-            if self._requests_this_minute > self.max_requests_per_minute:
-                await asyncio.sleep(60 - time_since_last_minute_start)
+        token_acquired = False
 
-        time_since_last_request = time.time() - self._last_request_time
+        if time.time() > self._auth_data["timeout"]:
+            # NOTE: the token is acquired outside of the lock, so that
+            # low priority requests don't hold up others while they wait
+            await self._acquire_token(priority)
+            token_acquired = True
 
-        if time_since_last_request < self.request_interval_time:
-            await asyncio.sleep(self.request_interval_time - time_since_last_request)
+            async with self._auth_lock:
+                if time.time() > self._auth_data["timeout"]:
+                    await self.authorize()
+                    token_acquired = False
 
-        if time.time() > self._auth_data["timeout"]:
-            await self.authorize()
-            await asyncio.sleep(self.request_interval_time)
+        # another request may have authorized while we waited for our token,
+        # in which case it's used for the request itself
+        if not token_acquired:
+            await self._acquire_token(priority)
 
         if headers is None:
             headers = {}
@@ -129,9 +358,6 @@ class OsuAPIClient:
             follow_redirects=True,
         )
 
-        self._last_request_time = time.time()
-        self._requests_this_minute += 1
-
         if response.status_code != 200:
             raise OsuAPIRequestError(
                 "Request returned non-200 status code",
@@ -154,24 +380,67 @@ class OsuAPIClient:
         else:
             return await response.aread()
 
-    async def get_beatmapset(self, id: int) -> dict[str, Any]:
+    async def get_beatmapset(
+        self,
+        id: int,
+        priority: OsuAPIRequestPriority = OsuAPIRequestPriority.INTERACTIVE,
+    ) -> dict[str, Any]:
         """Fetch a beatmap set's metadata from it's id."""
         url = f"https://osu.ppy.sh/api/v2/beatmapsets/{id}"
         return await self.request(
             method="GET",
             url=url,
+            priority=priority,
         )
 
-    async def get_beatmap(self, id: int) -> dict[str, Any]:
+    async def get_beatmap(
+        self,
+        id: int,
+        priority: OsuAPIRequestPriority = OsuAPIRequestPriority.INTERACTIVE,
+    ) -> dict[str, Any]:
         """Fetch a beatmap's metadata from it's id."""
         url = f"https://osu.ppy.sh/api/v2/beatmaps/{id}"
         return await self.request(
             method="GET",
             url=url,
+            priority=priority,
+        )
+
+    async def lookup_beatmap(
+        self,
+        checksum: str | None = None,
+        filename: str | None = None,
+        id: int | None = None,
+        priority: OsuAPIRequestPriority = OsuAPIRequestPriority.INTERACTIVE,
+    ) -> dict[str, Any]:
+        """Fetch a beatmap's metadata from it's checksum, filename or id."""
+        url = f"https://osu.ppy.sh/api/v2/beatmaps/lookup"
+        params = {}
+        if checksum is not None:
+            params["checksum"] = checksum
+        if filename is not None:
+            params["filename"] = filename
+        if id is not None:
+            params["id"] = str(id)
+
+        return await self.request(
+            method="GET",
+            url=url,
+            params=params,
+            priority=priority,
         )
 
-    async def get_beatmaps(self, ids: Sequence[int]) -> list[dict[str, Any]]:
-        """Fetch beatmaps' metadata from their ids."""
+    async def get_beatmaps(
+        self,
+        ids: Sequence[int],
+        priority: OsuAPIRequestPriority = OsuAPIRequestPriority.INTERACTIVE,
+    ) -> list[dict[str, Any]]:
+        """\
+        Fetch beatmaps' metadata from their ids.
+
+        At most `OSU_API_MAX_BEATMAPS_PER_REQUEST` ids may be requested at
+        once, and beatmaps which don't exist are omitted from the response.
+        """
         url = f"https://osu.ppy.sh/api/v2/beatmaps"
         params = {
             "ids[]": [str(id) for id in ids],
@@ -181,12 +450,13 @@ class OsuAPIClient:
                 method="GET",
                 url=url,
                 params=params,
+                priority=priority,
             )
         )["beatmaps"]
 
     async def get_beatmap_osz2(self, id: int) -> bytes:
         """Fetch a beatmapset's osu! file from it's id."""
-        raise NotImplementedError("not supported; need to proxy another mirror")
+        raise NotImplementedError("not supported; see `app.common.mirrors`")
 
         url = f"https://osu.ppy.sh/api/v2/beatmapsets/{id}/download"
         headers = {"User-Agent": "osu-framework"}
@@ -251,6 +521,7 @@ class OsuAPIClient:
         ]
         | None = None,
         cursor_string: str | None = None,
+        priority: OsuAPIRequestPriority = OsuAPIRequestPriority.INTERACTIVE,
     ) -> dict[str, Any]:
         url = f"https://osu.ppy.sh/api/v2/beatmapsets/search"
         headers = {
@@ -277,4 +548,5 @@ class OsuAPIClient:
             url=url,
             params=params,
             headers=headers,
+            priority=priority,
         )
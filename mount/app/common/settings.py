@@ -29,6 +29,9 @@ REDIS_PORT = config.get("REDIS_PORT", cast=int)
 OSU_API_CLIENT_ID = config.get("OSU_API_CLIENT_ID", cast=int)
 OSU_API_CLIENT_SECRET = config.get("OSU_API_CLIENT_SECRET")
 
+# additional credentials for the sharded crawler, as `id:secret,id:secret`
+OSU_API_CREDENTIALS = config.get("OSU_API_CREDENTIALS", default="")
+
 OSU_API_REQUEST_INTERVAL = config.get("OSU_API_REQUEST_INTERVAL", cast=float)
 OSU_API_MAX_REQUESTS_PER_MINUTE = config.get(
     "OSU_API_MAX_REQUESTS_PER_MINUTE",
@@ -38,3 +41,29 @@ OSU_API_MAX_REQUESTS_PER_MINUTE = config.get(
 # settings
 MAX_DISK_USAGE_GB = config.get("MAX_DISK_USAGE_GB", cast=int)
 MAX_RAM_USAGE_GB = config.get("MAX_RAM_USAGE_GB", cast=int)
+
+# the number of api worker processes (read by uvicorn too), which
+# each hold their own in-memory cache within MAX_RAM_USAGE_GB
+API_WORKERS = config.get("WEB_CONCURRENCY", cast=int, default=1)
+
+# coalesce cache misses across all workers (rather than per-process)
+SINGLEFLIGHT_DISTRIBUTED = config.get(
+    "SINGLEFLIGHT_DISTRIBUTED",
+    cast=bool,
+    default=False,
+)
+
+# pin cursor-based search pagination to a point in time
+SEARCH_USE_POINT_IN_TIME = config.get(
+    "SEARCH_USE_POINT_IN_TIME",
+    cast=bool,
+    default=False,
+)
+
+# on-disk .osz cache
+OSZ_CACHE_PATH = config.get("OSZ_CACHE_PATH", default=".data/osz")
+OSZ_CACHE_EVICTION_POLICY = config.get("OSZ_CACHE_EVICTION_POLICY", default="lru")
+
+# upstream mirrors to download .osz files from, as comma-separated
+# url templates (e.g. `https://kitsu.moe/api/d/{id}`)
+OSZ_MIRRORS = config.get("OSZ_MIRRORS", default="https://kitsu.moe/api/d/{id}")
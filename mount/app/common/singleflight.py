@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable
+from typing import Callable
+from typing import Hashable
+from typing import TypeVar
+
+import aioredis
+from app.common import logger
+from app.common import services
+from app.common import settings
+from prometheus_client import Counter
+
+T = TypeVar("T")
+
+SINGLEFLIGHT_CALLS = Counter(
+    "mirror_singleflight_calls_total",
+    "Number of calls which started a new in-flight operation.",
+    ["group"],
+)
+SINGLEFLIGHT_COALESCED = Counter(
+    "mirror_singleflight_coalesced_total",
+    "Number of calls which joined an existing in-flight operation.",
+    ["group"],
+)
+
+# how long a worker may hold a distributed lock before it expires
+LOCK_TIMEOUT = 30
+# how long a worker will wait for another worker's lock before giving up
+LOCK_BLOCKING_TIMEOUT = 30
+
+
+class SingleFlight:
+    """\
+    Coalesces concurrent calls for the same key into a single operation.
+
+    The operation runs in it's own task, so it isn't affected by any
+    individual caller being cancelled (e.g. by a client disconnecting).
+
+    When distributed, the operation is also run under a redis lock, so that
+    workers in other processes wait for it to complete before starting their
+    own. Operations should therefore check whether another worker has already
+    done their work (e.g. by checking the cache) before doing it themselves.
+    """
+
+    def __init__(
+        self,
+        group: str,
+        distributed: bool = settings.SINGLEFLIGHT_DISTRIBUTED,
+    ) -> None:
+        self.group = group
+        self.distributed = distributed
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, operation: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is not None:
+            SINGLEFLIGHT_COALESCED.labels(self.group).inc()
+        else:
+            SINGLEFLIGHT_CALLS.labels(self.group).inc()
+
+            if self.distributed:
+                task = asyncio.create_task(self._do_locked(key, operation))
+            else:
+                task = asyncio.create_task(operation())
+
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    async def _do_locked(
+        self,
+        key: Hashable,
+        operation: Callable[[], Awaitable[T]],
+    ) -> T:
+        lock = services.redis_client.lock(
+            f"mirror:singleflight:{self.group}:{key}",
+            timeout=LOCK_TIMEOUT,
+            blocking_timeout=LOCK_BLOCKING_TIMEOUT,
+        )
+
+        try:
+            acquired = await lock.acquire()
+        except aioredis.RedisError:
+            logger.warning("Failed to acquire lock", group=self.group, key=key)
+            acquired = False
+
+        try:
+            # if we couldn't get the lock, we carry on without it
+            return await operation()
+        finally:
+            if acquired:
+                try:
+                    await lock.release()
+                except aioredis.RedisError:
+                    # the lock may have expired while we held it
+                    pass
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from typing import Any
+from typing import Mapping
+
+# NOTE: bump this whenever the inputs below change, then run
+# `python -m app.migrate_indices` to rebuild the suggestions of existing documents
+# (the crawler only rebuilds those of beatmapsets which can still update).
+SUGGEST_FORMAT_VERSION = 1
+
+# the maximum weight elasticsearch allows for a completion
+MAX_SUGGEST_WEIGHT = 2**31 - 1
+
+
+def get_suggest_field(beatmapset: Mapping[str, Any]) -> dict[str, Any]:
+    """\
+    Build the completion suggester field of a beatmapset's document.
+
+    Beatmapsets can be suggested by a prefix of their artist, title or
+    creator, and more popular beatmapsets are suggested first.
+    """
+    inputs = [
+        f"{beatmapset['artist']} - {beatmapset['title']}",
+        beatmapset["artist"],
+        beatmapset["title"],
+        beatmapset["creator"],
+        beatmapset.get("artist_unicode") or "",
+        beatmapset.get("title_unicode") or "",
+    ]
+
+    return {
+        # the unicode fields are often the same as their ascii counterparts
+        "input": [input for input in dict.fromkeys(inputs) if input],
+        "weight": min(beatmapset.get("favourite_count", 0), MAX_SUGGEST_WEIGHT),
+    }
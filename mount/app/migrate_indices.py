@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+
+from app.common import indices
+from app.common import logger
+from app.common import settings
+from elasticsearch import AsyncElasticsearch
+
+
+async def async_main() -> int:
+    elastic_client = AsyncElasticsearch(
+        f"http://{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}",
+        basic_auth=(settings.ELASTIC_USER, settings.ELASTIC_PASS),
+    )
+
+    try:
+        await indices.migrate_indices(elastic_client)
+        await indices.backfill_suggestions(elastic_client)
+        await indices.backfill_osu_direct_rows(elastic_client)
+    finally:
+        await elastic_client.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    logger.overwrite_exception_hook()
+    atexit.register(logger.restore_exception_hook)
+
+    logger.configure_logging(
+        app_env=settings.APP_ENV,
+        log_level=settings.LOG_LEVEL,
+    )
+
+    exit_code = asyncio.run(async_main())
+    raise SystemExit(exit_code)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from dataclasses import fields
+from typing import Any
+from typing import Mapping
+
+# NOTE: these hold only the fields the mirror serves in it's compact &
+# osu!direct formats; the full osu!api payloads are still kept as dicts.
+# they're slotted, as they're held in the in-memory caches in large numbers,
+# and orjson serializes them natively, so they needn't be converted back.
+# fields the osu!api may omit (e.g. for deleted users) are looked up leniently.
+
+
+@dataclass(slots=True)
+class Beatmap:
+    id: int
+    beatmapset_id: int
+    checksum: str | None
+    version: str
+    mode: str
+    mode_int: int
+    status: str
+    ranked: int
+    difficulty_rating: float
+    bpm: float | None
+    total_length: int
+    hit_length: int
+    cs: float
+    drain: float
+    accuracy: float
+    ar: float
+    last_updated: str | None
+
+    @classmethod
+    def from_osu_api(cls, data: Mapping[str, Any]) -> Beatmap:
+        return cls(
+            id=data["id"],
+            beatmapset_id=data["beatmapset_id"],
+            checksum=data.get("checksum"),
+            version=data["version"],
+            mode=data["mode"],
+            mode_int=data["mode_int"],
+            status=data["status"],
+            ranked=data["ranked"],
+            difficulty_rating=data["difficulty_rating"],
+            bpm=data.get("bpm"),
+            total_length=data["total_length"],
+            hit_length=data["hit_length"],
+            cs=data["cs"],
+            drain=data["drain"],
+            accuracy=data["accuracy"],
+            ar=data["ar"],
+            last_updated=data.get("last_updated"),
+        )
+
+
+@dataclass(slots=True)
+class Beatmapset:
+    id: int
+    user_id: int | None
+    artist: str
+    artist_unicode: str
+    title: str
+    title_unicode: str
+    creator: str
+    source: str
+    status: str
+    ranked: int
+    bpm: float | None
+    nsfw: bool
+    video: bool
+    ranked_date: str | None
+    submitted_date: str | None
+    last_updated: str | None
+    beatmaps: list[Beatmap]
+
+    @classmethod
+    def from_osu_api(cls, data: Mapping[str, Any]) -> Beatmapset:
+        return cls(
+            id=data["id"],
+            user_id=data.get("user_id"),
+            artist=data["artist"],
+            artist_unicode=data["artist_unicode"],
+            title=data["title"],
+            title_unicode=data["title_unicode"],
+            creator=data["creator"],
+            source=data.get("source", ""),
+            status=data["status"],
+            ranked=data["ranked"],
+            bpm=data.get("bpm"),
+            nsfw=data.get("nsfw", False),
+            video=data.get("video", False),
+            ranked_date=data.get("ranked_date"),
+            submitted_date=data.get("submitted_date"),
+            last_updated=data.get("last_updated"),
+            beatmaps=[Beatmap.from_osu_api(beatmap) for beatmap in data["beatmaps"]],
+        )
+
+
+BEATMAP_FIELDS = tuple(field.name for field in fields(Beatmap))
+BEATMAPSET_FIELDS = tuple(
+    field.name for field in fields(Beatmapset) if field.name != "beatmaps"
+)
+
+# the defaults of the beatmapset fields the osu!api may omit, when not null
+BEATMAPSET_FIELD_DEFAULTS: dict[str, Any] = {
+    "source": "",
+    "nsfw": False,
+    "video": False,
+}
+
+
+def get_compact_beatmapset(data: Mapping[str, Any]) -> dict[str, Any]:
+    """\
+    Project an osu!api beatmapset payload onto the fields of the models, as
+    the same dict they'd serialize to. Used for results which are only served
+    as they are (e.g. searches), where building models costs more than it saves.
+    """
+    compact_beatmapset = {
+        field: data.get(field, BEATMAPSET_FIELD_DEFAULTS.get(field))
+        for field in BEATMAPSET_FIELDS
+    }
+    compact_beatmapset["beatmaps"] = [
+        {field: beatmap.get(field) for field in BEATMAP_FIELDS}
+        for beatmap in data["beatmaps"]
+    ]
+    return compact_beatmapset
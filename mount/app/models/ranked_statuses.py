@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from datetime import datetime
+from datetime import timedelta
 from enum import IntEnum
 
 
@@ -62,3 +64,47 @@ def osu_direct_to_osu_api_status(osu_api_status: OsuDirectStatus) -> OsuAPIRanke
         OsuDirectStatus.QUALIFIED: OsuAPIRankedStatus.QUALIFIED,
         OsuDirectStatus.LOVED: OsuAPIRankedStatus.LOVED,
     }[osu_api_status]
+
+
+# graveyarded maps are checked more rarely the longer they've been untouched
+GRAVEYARD_MIN_UPDATE_INTERVAL = timedelta(days=1)
+GRAVEYARD_MAX_UPDATE_INTERVAL = timedelta(days=30)
+GRAVEYARD_UPDATE_INTERVAL_SCALE = 10
+
+
+def get_update_interval(
+    status: str,
+    last_updated: datetime | None = None,
+) -> timedelta | None:
+    """\
+    Get how often a beatmapset of the given (osu!api v2) status may change.
+
+    Returns `None` for statuses which can never be updated.
+    """
+    match status:
+        case "ranked" | "approved":
+            # it is not possible to update a ranked or approved beatmapset
+            return None
+        case "loved":
+            # loved maps can *technically* be updated
+            return timedelta(days=1)
+        case "graveyard":
+            if last_updated is None:
+                return GRAVEYARD_MIN_UPDATE_INTERVAL
+
+            time_since_update = datetime.now(last_updated.tzinfo) - last_updated
+            return min(
+                max(
+                    time_since_update / GRAVEYARD_UPDATE_INTERVAL_SCALE,
+                    GRAVEYARD_MIN_UPDATE_INTERVAL,
+                ),
+                GRAVEYARD_MAX_UPDATE_INTERVAL,
+            )
+        case "qualified":
+            return timedelta(minutes=5)
+        case "pending":
+            return timedelta(minutes=10)
+        case "wip":
+            return timedelta(minutes=5)
+        case _:
+            raise Exception(f"Unknown beatmapset status: {status}")
@@ -0,0 +1,9 @@
+from __future__ import annotations
+
+from enum import Enum
+
+
+class ResponseFormat(str, Enum):
+    FULL = "full"
+    COMPACT = "compact"
+    OSU_DIRECT = "osu_direct"
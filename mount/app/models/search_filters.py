@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import NamedTuple
+
+
+class SearchFilters(NamedTuple):
+    """\
+    Optional bounds (inclusive) to narrow beatmapset searches by.
+
+    The beatmap-level bounds (stars, length, ar, od & cs) match
+    beatmapsets with a single beatmap within all of them, which is
+    also of the searched mode & status.
+    """
+
+    min_stars: float | None = None
+    max_stars: float | None = None
+    min_bpm: float | None = None
+    max_bpm: float | None = None
+    min_length: int | None = None
+    max_length: int | None = None
+    min_ar: float | None = None
+    max_ar: float | None = None
+    min_od: float | None = None
+    max_od: float | None = None
+    min_cs: float | None = None
+    max_cs: float | None = None
+    min_ranked_date: datetime | None = None
+    max_ranked_date: datetime | None = None
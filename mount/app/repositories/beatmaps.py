@@ -1,14 +1,30 @@
 from __future__ import annotations
 
+import asyncio
 import datetime
 from typing import Any
+from typing import Sequence
 
+import elasticsearch
+from app.common import cache
+from app.common import logger
 from app.common import services
 from app.common import settings
+from app.common.negative_cache import NegativeCache
+from app.common.singleflight import SingleFlight
 
 
 # TODO: typeddict model for mapping?
-id_cache: dict[int, dict[str, Any]] = {}
+id_cache = cache.TieredCache("beatmaps")
+id_flights = SingleFlight("beatmaps")
+
+# md5 checksum -> beatmap id
+checksum_cache = cache.TieredCache("beatmap_checksums")
+checksum_flights = SingleFlight("beatmap_checksums")
+
+# ids & checksums which the osu!api doesn't know of
+missing_id_cache = NegativeCache("missing_beatmaps")
+missing_checksum_cache = NegativeCache("missing_beatmap_checksums")
 
 
 async def get_from_id(id: int) -> dict[str, Any] | None:
@@ -18,33 +34,47 @@ async def get_from_id(id: int) -> dict[str, Any] | None:
     https://github.com/ppy/osu-api/wiki#apiget_beatmaps
     """
 
-    # fetch the beatmap from ram if possible
-    if beatmap_data := id_cache.get(id):
+    # fetch the beatmap from ram (or redis) if possible
+    if beatmap_data := await id_cache.get(id):
+        return beatmap_data
+
+    # coalesce concurrent misses for the same beatmap into a single fetch
+    return await id_flights.do(id, lambda: _fetch_from_id(id))
+
+
+async def _fetch_from_id(id: int) -> dict[str, Any] | None:
+    # another worker may have fetched the beatmap while we were waiting
+    if beatmap_data := await id_cache.get(id):
         return beatmap_data
 
     # fetch the beatmap from elasticsearch if possible
-    if await services.elastic_client.exists(
-        index=settings.BEATMAPS_INDEX,
-        id=str(id),
-    ):
-        response = await services.elastic_client.get_source(
+    try:
+        response = await services.elastic_client.get(
             index=settings.BEATMAPS_INDEX,
             id=str(id),
+            source_includes=["data"],
         )
+    except elasticsearch.NotFoundError:
+        response = None
 
+    if response is not None:
         # we found the map from elasticsearch
-        beatmap_data = response.body["data"]
+        beatmap_data = response.body["_source"]["data"]
     else:
+        if await missing_id_cache.contains(id):
+            return None
+
         try:
             beatmap_data = await services.osu_api_client.get_beatmap(id)
         except services.OsuAPIRequestError as exc:
             if exc.status_code == 404:
+                await missing_id_cache.add(id)
                 return None
             else:
                 raise
         else:
             # save the beatmap into our elasticsearch index
-            await services.elastic_client.create(
+            await services.elastic_client.index(
                 index=settings.BEATMAPS_INDEX,
                 id=str(id),
                 document={
@@ -54,12 +84,245 @@ async def get_from_id(id: int) -> dict[str, Any] | None:
                 },
             )
 
-    # cache the beatmap in ram
-    # id_cache[id] = beatmap_data
+    # cache the beatmap in ram (and redis)
+    await id_cache.set(id, beatmap_data, ttl=cache.get_ttl(beatmap_data))
 
     return beatmap_data
 
 
+async def get_many_from_ids(ids: Sequence[int]) -> list[dict[str, Any] | None]:
+    """\
+    Fetch many beatmaps' metadata from their ids, in the order given.
+
+    Beatmaps which aren't cached are fetched from elasticsearch in a single
+    request, and any still missing are fetched from the osu!api in as few
+    requests as possible, then written back to elasticsearch in bulk.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    found_beatmaps: dict[int, dict[str, Any]] = {}
+
+    # fetch what we can from ram (or redis)
+    cached_beatmaps = await asyncio.gather(*(id_cache.get(id) for id in unique_ids))
+    for id, beatmap_data in zip(unique_ids, cached_beatmaps):
+        if beatmap_data is not None:
+            found_beatmaps[id] = beatmap_data
+
+    # then from elasticsearch
+    uncached_ids = [id for id in unique_ids if id not in found_beatmaps]
+    if uncached_ids:
+        elastic_response = await services.elastic_client.mget(
+            index=settings.BEATMAPS_INDEX,
+            ids=[str(id) for id in uncached_ids],
+            source_includes=["data"],
+        )
+        for doc in elastic_response["docs"]:
+            if doc["found"]:
+                found_beatmaps[int(doc["_id"])] = doc["_source"]["data"]
+
+    # and finally from the osu!api, unless we know it doesn't have them
+    unknown_ids = [
+        id
+        for id in uncached_ids
+        if id not in found_beatmaps and not await missing_id_cache.contains(id)
+    ]
+    if unknown_ids:
+        chunk_size = services.OSU_API_MAX_BEATMAPS_PER_REQUEST
+        chunks = await asyncio.gather(
+            *(
+                services.osu_api_client.get_beatmaps(unknown_ids[i : i + chunk_size])
+                for i in range(0, len(unknown_ids), chunk_size)
+            ),
+        )
+        fetched_beatmaps = [beatmap for chunk in chunks for beatmap in chunk]
+
+        if fetched_beatmaps:
+            await _bulk_index(fetched_beatmaps)
+
+        for beatmap_data in fetched_beatmaps:
+            found_beatmaps[beatmap_data["id"]] = beatmap_data
+
+        for id in unknown_ids:
+            if id not in found_beatmaps:
+                await missing_id_cache.add(id)
+
+    # cache everything we didn't already have in ram (and redis)
+    for id in uncached_ids:
+        if beatmap_data := found_beatmaps.get(id):
+            await id_cache.set(id, beatmap_data, ttl=cache.get_ttl(beatmap_data))
+
+    return [found_beatmaps.get(id) for id in ids]
+
+
+async def _bulk_index(beatmaps: list[dict[str, Any]]) -> None:
+    creation_time = datetime.datetime.now()
+
+    operations: list[dict[str, Any]] = []
+    for beatmap_data in beatmaps:
+        operations.append(
+            {
+                "index": {
+                    "_index": settings.BEATMAPS_INDEX,
+                    "_id": str(beatmap_data["id"]),
+                },
+            },
+        )
+        operations.append(
+            {
+                "data": beatmap_data,
+                "created_at": creation_time.isoformat(),
+                "updated_at": creation_time.isoformat(),
+            },
+        )
+
+    elastic_response = await services.elastic_client.bulk(operations=operations)
+    if elastic_response["errors"]:
+        logger.error(
+            "Failed to write some beatmaps to elasticsearch",
+            errors=[
+                result["error"]
+                for item in elastic_response["items"]
+                for result in item.values()
+                if "error" in result
+            ],
+        )
+
+
 async def get_from_checksum(checksum: str) -> dict[str, Any] | None:
     """Get a beatmap from it's md5 checksum."""
-    ...
+
+    # resolve the checksum to a beatmap id from ram (or redis) if possible
+    if beatmap_id := await checksum_cache.get(checksum):
+        beatmap_data = await get_from_id(beatmap_id)
+        if beatmap_data is not None and beatmap_data["checksum"] == checksum:
+            return beatmap_data
+
+        # the beatmap has been updated since; this checksum is stale
+        await checksum_cache.delete(checksum)
+
+    # coalesce concurrent misses for the same checksum into a single fetch
+    return await checksum_flights.do(
+        checksum,
+        lambda: _fetch_from_checksum(checksum),
+    )
+
+
+async def _fetch_from_checksum(checksum: str) -> dict[str, Any] | None:
+    # fetch the beatmap from elasticsearch if possible
+    elastic_response = await services.elastic_client.search(
+        index=settings.BEATMAPS_INDEX,
+        query={"bool": {"filter": {"term": {"data.checksum": checksum}}}},
+        size=1,
+    )
+
+    if hits := elastic_response["hits"]["hits"]:
+        # we found the map from elasticsearch
+        beatmap_data = hits[0]["_source"]["data"]
+    else:
+        if await missing_checksum_cache.contains(checksum):
+            return None
+
+        try:
+            beatmap_data = await services.osu_api_client.lookup_beatmap(
+                checksum=checksum,
+            )
+        except services.OsuAPIRequestError as exc:
+            if exc.status_code == 404:
+                await missing_checksum_cache.add(checksum)
+                return None
+            else:
+                raise
+        else:
+            # save the beatmap into our elasticsearch index; this may
+            # overwrite an older version of the beatmap with a new checksum
+            await services.elastic_client.index(
+                index=settings.BEATMAPS_INDEX,
+                id=str(beatmap_data["id"]),
+                document={
+                    "data": beatmap_data,
+                    "created_at": datetime.datetime.now().isoformat(),
+                    "updated_at": datetime.datetime.now().isoformat(),
+                },
+            )
+
+    # cache the beatmap & it's checksum in ram (and redis)
+    await id_cache.set(
+        beatmap_data["id"],
+        beatmap_data,
+        ttl=cache.get_ttl(beatmap_data),
+    )
+    await checksum_cache.set(checksum, beatmap_data["id"])
+
+    return beatmap_data
+
+
+async def get_many_from_checksums(
+    checksums: Sequence[str],
+) -> list[dict[str, Any] | None]:
+    """\
+    Get many beatmaps from their md5 checksums, in the order given.
+
+    Checksums are resolved through our cache & elasticsearch in bulk; the
+    osu!api can only look up checksums one at a time, so any which remain
+    are looked up individually (and concurrently).
+    """
+    unique_checksums = list(dict.fromkeys(checksums))
+    found_beatmaps: dict[str, dict[str, Any]] = {}
+
+    # resolve the checksums to beatmap ids from ram (or redis) if possible
+    cached_ids = await asyncio.gather(
+        *(checksum_cache.get(checksum) for checksum in unique_checksums),
+    )
+    resolved_ids = {
+        checksum: beatmap_id
+        for checksum, beatmap_id in zip(unique_checksums, cached_ids)
+        if beatmap_id is not None
+    }
+    if resolved_ids:
+        resolved_beatmaps = await get_many_from_ids(list(resolved_ids.values()))
+        for checksum, beatmap_data in zip(resolved_ids, resolved_beatmaps):
+            if beatmap_data is not None and beatmap_data["checksum"] == checksum:
+                found_beatmaps[checksum] = beatmap_data
+            else:
+                # the beatmap has been updated since; this checksum is stale
+                await checksum_cache.delete(checksum)
+
+    # fetch the rest from elasticsearch if possible
+    missing_checksums = [
+        checksum for checksum in unique_checksums if checksum not in found_beatmaps
+    ]
+    if missing_checksums:
+        elastic_response = await services.elastic_client.search(
+            index=settings.BEATMAPS_INDEX,
+            query={"bool": {"filter": {"terms": {"data.checksum": missing_checksums}}}},
+            size=len(missing_checksums),
+            source_includes=["data"],
+        )
+        for hit in elastic_response["hits"]["hits"]:
+            beatmap_data = hit["_source"]["data"]
+            found_beatmaps[beatmap_data["checksum"]] = beatmap_data
+
+            await id_cache.set(
+                beatmap_data["id"],
+                beatmap_data,
+                ttl=cache.get_ttl(beatmap_data),
+            )
+            await checksum_cache.set(beatmap_data["checksum"], beatmap_data["id"])
+
+    # and finally look up the remaining checksums from the osu!api
+    unknown_checksums = [
+        checksum for checksum in missing_checksums if checksum not in found_beatmaps
+    ]
+    looked_up_beatmaps = await asyncio.gather(
+        *(
+            checksum_flights.do(
+                checksum,
+                lambda checksum=checksum: _fetch_from_checksum(checksum),
+            )
+            for checksum in unknown_checksums
+        ),
+    )
+    for checksum, beatmap_data in zip(unknown_checksums, looked_up_beatmaps):
+        if beatmap_data is not None:
+            found_beatmaps[checksum] = beatmap_data
+
+    return [found_beatmaps.get(checksum) for checksum in checksums]
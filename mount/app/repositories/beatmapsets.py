@@ -1,56 +1,330 @@
 from __future__ import annotations
 
+import asyncio
+import base64
 import datetime
+import time
 from typing import Any
+from typing import NamedTuple
+from typing import Sequence
 
 import elasticsearch
+import orjson
+from app.common import cache
+from app.common import logger
+from app.common import osu_direct as osu_direct_rows
 from app.common import services
 from app.common import settings
+from app.common import suggestions
+from app.common.content_hashes import get_beatmap_content_hash
+from app.common.content_hashes import get_beatmapset_content_hash
+from app.models.beatmaps import BEATMAP_FIELDS
+from app.models.beatmaps import Beatmapset
+from app.models.beatmaps import BEATMAPSET_FIELDS
+from app.models.beatmaps import get_compact_beatmapset
 from app.models.gamemodes import GameMode
+from app.models.ranked_statuses import get_update_interval
 from app.models.ranked_statuses import OsuAPIRankedStatus
+from app.models.response_formats import ResponseFormat
+from app.models.search_filters import SearchFilters
+from prometheus_client import Counter
+from prometheus_client import Histogram
 
 # TODO: these return ["data"]; this is probably wrong
 
+id_cache = cache.TieredCache("beatmapsets")
+
+# compact beatmapsets are held in memory as models, so they're built once
+# per cache fill, rather than projected from the full payload on each request
+compact_id_cache = cache.TieredCache(
+    "compact_beatmapsets",
+    decode=Beatmapset.from_osu_api,
+)
+
+# NOTE: search results are invalidated by the search generation changing;
+# the ttl is only a backstop in case the crawler fails to bump it. they're
+# only served as they are, so compact ones are kept as dicts rather than models
+search_cache = cache.TieredCache("beatmapset_searches")
+SEARCH_CACHE_TTL = datetime.timedelta(minutes=5)
+
+SEARCH_ELASTIC_SECONDS = Histogram(
+    "mirror_search_elastic_seconds",
+    "Time spent performing beatmapset searches in elasticsearch.",
+)
+SEARCH_CACHE_SAVED_SECONDS = Counter(
+    "mirror_search_cache_saved_seconds_total",
+    "Estimated elasticsearch time saved by serving searches from the cache.",
+)
+
+SEARCH_POINT_IN_TIME_KEEP_ALIVE = "1m"
+
+# suggestions are served on each keystroke, so they've a tight latency budget
+SUGGEST_REQUEST_TIMEOUT = 0.25
+
+# a small in-process cache of the most commonly typed prefixes
+suggest_cache = cache.LRUCache("beatmapset_suggestions", max_bytes=4 * 1024**2)
+SUGGEST_CACHE_TTL = 60
+
+# the `_source` fields fetched for each response format
+SOURCE_INCLUDES: dict[ResponseFormat, list[str]] = {
+    ResponseFormat.FULL: ["data"],
+    ResponseFormat.COMPACT: [
+        *(f"data.{field}" for field in BEATMAPSET_FIELDS),
+        *(f"data.beatmaps.{field}" for field in BEATMAP_FIELDS),
+    ],
+    ResponseFormat.OSU_DIRECT: ["osu_direct"],
+}
+
+# a moving average of elasticsearch search times, used to estimate time saved
+_average_search_time = 0.0
+
+
+class BeatmapsetEntry(NamedTuple):
+    data: dict[str, Any] | Beatmapset
+    # whether the data was fetched within it's status' update interval
+    fresh: bool
+
+
+def _is_fresh(beatmapset_data: dict[str, Any], checked_at: str) -> bool:
+    update_interval = get_update_interval(
+        beatmapset_data["status"],
+        # NOTE: fromisoformat doesn't support the "Z" suffix until python 3.11
+        last_updated=datetime.datetime.fromisoformat(
+            beatmapset_data["last_updated"].replace("Z", "+00:00"),
+        ),
+    )
+    if update_interval is None:
+        return True
+
+    checked_at_time = datetime.datetime.fromisoformat(checked_at)
+    return checked_at_time > datetime.datetime.now() - update_interval
+
+
+async def get_entry_from_id(
+    id: int,
+    format: ResponseFormat = ResponseFormat.FULL,
+) -> BeatmapsetEntry | None:
+    """\
+    Fetch a beatmapset in the given format (either full or compact),
+    alongside whether it's still within it's status' update interval.
+
+    Full beatmapsets are returned as the osu!api's payload, and compact
+    ones as models. Only fresh beatmapsets are cached; compact ones are
+    projected from the cached full beatmapset when it's available.
+    """
+    # fetch the beatmapset from ram (or redis) if possible
+    # NOTE: the cache ttls are no longer than the update intervals,
+    # so cached beatmapsets are never too far out of date
+    if format is ResponseFormat.COMPACT:
+        if (beatmapset := await compact_id_cache.get(id)) is not None:
+            return BeatmapsetEntry(beatmapset, fresh=True)
+
+    if beatmapset_data := await id_cache.get(id):
+        if format is ResponseFormat.COMPACT:
+            beatmapset = Beatmapset.from_osu_api(beatmapset_data)
+            await compact_id_cache.set(
+                id,
+                beatmapset,
+                ttl=cache.get_ttl(beatmapset_data),
+            )
+            return BeatmapsetEntry(beatmapset, fresh=True)
+
+        return BeatmapsetEntry(beatmapset_data, fresh=True)
 
-async def get_from_id(id: int) -> dict[str, Any] | None:
     try:
         response = await services.elastic_client.get(
             index=settings.BEATMAPSETS_INDEX,
             id=str(id),
+            source_includes=[*SOURCE_INCLUDES[format], "updated_at", "checked_at"],
         )
     except elasticsearch.NotFoundError:
         return None
 
-    return response.body["_source"]["data"]
+    beatmapset_data = response.body["_source"]["data"]
+    # NOTE: the crawler doesn't rewrite unchanged beatmapsets, it only
+    # records when it last checked them (documents before this used updated_at)
+    source = response.body["_source"]
+    fresh = _is_fresh(beatmapset_data, source.get("checked_at", source["updated_at"]))
 
+    if format is ResponseFormat.COMPACT:
+        beatmapset = Beatmapset.from_osu_api(beatmapset_data)
+        if fresh:
+            await compact_id_cache.set(
+                id,
+                beatmapset,
+                ttl=cache.get_ttl(beatmapset_data),
+            )
 
-async def create(osuapi_data: dict[str, Any]) -> dict[str, Any]:
-    creation_time = datetime.datetime.now()
+        return BeatmapsetEntry(beatmapset, fresh)
+
+    if fresh:
+        await id_cache.set(id, beatmapset_data, ttl=cache.get_ttl(beatmapset_data))
+
+    return BeatmapsetEntry(beatmapset_data, fresh)
+
+
+async def get_from_id(
+    id: int,
+    format: ResponseFormat = ResponseFormat.FULL,
+) -> dict[str, Any] | Beatmapset | None:
+    """Fetch a beatmapset in the given format, regardless of it's freshness."""
+    entry = await get_entry_from_id(id, format)
+    if entry is None:
+        return None
+
+    return entry.data
+
+
+async def get_many_from_ids(ids: Sequence[int]) -> list[dict[str, Any] | None]:
+    """\
+    Fetch many beatmapsets from their ids, in the order given.
 
-    # TODO: use bulk api
+    Beatmapsets which aren't cached are fetched from
+    elasticsearch in a single request.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    found_beatmapsets: dict[int, dict[str, Any]] = {}
 
-    await services.elastic_client.create(
-        index=settings.BEATMAPSETS_INDEX,
-        id=str(osuapi_data["id"]),
-        document={
-            "data": osuapi_data,
-            "created_at": creation_time.isoformat(),
-            "updated_at": creation_time.isoformat(),
-        },
+    cached_beatmapsets = await asyncio.gather(
+        *(id_cache.get(id) for id in unique_ids),
     )
+    for id, beatmapset_data in zip(unique_ids, cached_beatmapsets):
+        if beatmapset_data is not None:
+            found_beatmapsets[id] = beatmapset_data
+
+    missing_ids = [id for id in unique_ids if id not in found_beatmapsets]
+    if missing_ids:
+        elastic_response = await services.elastic_client.mget(
+            index=settings.BEATMAPSETS_INDEX,
+            ids=[str(id) for id in missing_ids],
+            source_includes=SOURCE_INCLUDES[ResponseFormat.FULL],
+        )
+        for doc in elastic_response["docs"]:
+            if not doc["found"]:
+                continue
+
+            beatmapset_data = doc["_source"]["data"]
+            found_beatmapsets[beatmapset_data["id"]] = beatmapset_data
+            await id_cache.set(
+                beatmapset_data["id"],
+                beatmapset_data,
+                ttl=cache.get_ttl(beatmapset_data),
+            )
+
+    return [found_beatmapsets.get(id) for id in ids]
+
+
+async def create(osuapi_data: dict[str, Any]) -> dict[str, Any]:
+    await create_many([osuapi_data])
+    return osuapi_data
 
-    for beatmap_data in osuapi_data["beatmaps"]:
-        await services.elastic_client.create(
-            index=settings.BEATMAPS_INDEX,
-            id=str(beatmap_data["id"]),
-            document={
-                "data": beatmap_data,
+
+async def create_many(beatmapsets: list[dict[str, Any]]) -> None:
+    """\
+    Write many beatmapsets (& their beatmaps) from the osu!api into
+    elasticsearch in a single bulk request, and cache them.
+    """
+    creation_time = datetime.datetime.now()
+
+    # NOTE: we index (rather than create) these documents, since
+    # another worker may have already written them in the meantime
+    operations: list[dict[str, Any]] = []
+    for osuapi_data in beatmapsets:
+        operations.append(
+            {
+                "index": {
+                    "_index": settings.BEATMAPSETS_INDEX,
+                    "_id": str(osuapi_data["id"]),
+                },
+            },
+        )
+        operations.append(
+            {
+                "data": osuapi_data,
+                "osu_direct": osu_direct_rows.format_row(
+                    Beatmapset.from_osu_api(osuapi_data),
+                ),
+                "osu_direct_row_format_version": osu_direct_rows.ROW_FORMAT_VERSION,
+                "suggest": suggestions.get_suggest_field(osuapi_data),
+                "suggest_format_version": suggestions.SUGGEST_FORMAT_VERSION,
+                # hashed like the crawler does, so it needn't rewrite them again
+                "content_hash": get_beatmapset_content_hash(osuapi_data),
                 "created_at": creation_time.isoformat(),
                 "updated_at": creation_time.isoformat(),
+                "checked_at": creation_time.isoformat(),
             },
         )
 
-    return osuapi_data
+        for beatmap_data in osuapi_data["beatmaps"]:
+            operations.append(
+                {
+                    "index": {
+                        "_index": settings.BEATMAPS_INDEX,
+                        "_id": str(beatmap_data["id"]),
+                    },
+                },
+            )
+            operations.append(
+                {
+                    "data": beatmap_data,
+                    "content_hash": get_beatmap_content_hash(beatmap_data),
+                    "created_at": creation_time.isoformat(),
+                    "updated_at": creation_time.isoformat(),
+                    "checked_at": creation_time.isoformat(),
+                },
+            )
+
+    if not operations:
+        return
+
+    elastic_response = await services.elastic_client.bulk(operations=operations)
+    if elastic_response["errors"]:
+        logger.error(
+            "Failed to write some beatmapsets to elasticsearch",
+            errors=[
+                result["error"]
+                for item in elastic_response["items"]
+                for result in item.values()
+                if "error" in result
+            ],
+        )
+
+    for osuapi_data in beatmapsets:
+        await id_cache.set(
+            osuapi_data["id"],
+            osuapi_data,
+            ttl=cache.get_ttl(osuapi_data),
+        )
+        # the compact model is rebuilt from the new payload when it's next requested
+        await compact_id_cache.delete(osuapi_data["id"])
+
+
+def encode_cursor(search_after: list[Any], pit_id: str | None) -> str:
+    return base64.urlsafe_b64encode(
+        orjson.dumps({"search_after": search_after, "pit_id": pit_id}),
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[list[Any], str | None]:
+    """Decode a search cursor, raising a `ValueError` if it's invalid."""
+    data = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(data, dict) or not isinstance(data.get("search_after"), list):
+        raise ValueError("Invalid search cursor")
+
+    # our sort values are scores & dates (numbers), and ids (strings, as
+    # they're mapped as keywords)
+    search_after = data["search_after"]
+    if not all(
+        isinstance(value, (int, float, str)) and not isinstance(value, bool)
+        for value in search_after
+    ):
+        raise ValueError("Invalid search cursor")
+
+    pit_id = data.get("pit_id")
+    if pit_id is not None and not isinstance(pit_id, str):
+        raise ValueError("Invalid search cursor")
+
+    return search_after, pit_id
 
 
 async def search(
@@ -59,12 +333,120 @@ async def search(
     offset: int,
     mode: int,
     status: int,
+    cursor: str | None = None,
+    format: ResponseFormat = ResponseFormat.FULL,
+    filters: SearchFilters = SearchFilters(),
+) -> dict[str, Any]:
+    """\
+    Search for beatmapsets.
+
+    Results can be paged through either by offset (which becomes more
+    expensive the deeper it goes), or by passing the returned cursor;
+    a `ValueError` is raised if the cursor is invalid or has expired.
+
+    Only the fields required by the response format are fetched; for the
+    osu!direct format, the beatmapsets' pre-rendered rows are returned (as
+    `rows`) in place of their data.
+    """
+    global _average_search_time
+
+    if query is not None:
+        # normalize the query to improve our cache hit rate
+        query = " ".join(query.lower().split()) or None
+
+    # NOTE: point in time ids are unique to each client's pagination
+    use_cache = cursor is None or not settings.SEARCH_USE_POINT_IN_TIME
+
+    if use_cache:
+        generation = await cache.get_search_generation()
+        cache_key = (
+            f"{generation}:{format.value}:{int(mode)}:{int(status)}:"
+            f"{amount}:{offset}:{cursor}:{':'.join(map(str, filters))}:{query}"
+        )
+
+        search_results = await search_cache.get(cache_key)
+        if search_results is not None:
+            SEARCH_CACHE_SAVED_SECONDS.inc(_average_search_time)
+            return search_results
+
+    start_time = time.perf_counter()
+    search_results = await _search(
+        query,
+        amount,
+        offset,
+        mode,
+        status,
+        cursor,
+        format,
+        filters,
+    )
+    search_time = time.perf_counter() - start_time
+
+    SEARCH_ELASTIC_SECONDS.observe(search_time)
+    _average_search_time = _average_search_time * 0.9 + search_time * 0.1
+
+    if use_cache:
+        await search_cache.set(cache_key, search_results, ttl=SEARCH_CACHE_TTL)
+
+    return search_results
+
+
+# the fields each of the search filters' bounds apply to
+BEATMAPSET_RANGE_FILTER_FIELDS = {
+    "bpm": "data.bpm",
+    "ranked_date": "data.ranked_date",
+}
+BEATMAP_RANGE_FILTER_FIELDS = {
+    "stars": "data.beatmaps.difficulty_rating",
+    "length": "data.beatmaps.total_length",
+    "ar": "data.beatmaps.ar",
+    "od": "data.beatmaps.accuracy",
+    "cs": "data.beatmaps.cs",
+}
+
+
+def _build_range_filters(
+    filters: SearchFilters,
+    fields: dict[str, str],
 ) -> list[dict[str, Any]]:
-    """Search for beatmapsets."""
-    query_conditions: list[dict[str, Any]] = []
+    range_filters: list[dict[str, Any]] = []
+
+    for name, field in fields.items():
+        bounds: dict[str, Any] = {}
+
+        minimum = getattr(filters, f"min_{name}")
+        if minimum is not None:
+            bounds["gte"] = minimum
+
+        maximum = getattr(filters, f"max_{name}")
+        if maximum is not None:
+            bounds["lte"] = maximum
+
+        if bounds:
+            range_filters.append({"range": {field: bounds}})
+
+    return range_filters
+
+
+def build_search_query(
+    query: str | None,
+    mode: int,
+    status: int,
+    filters: SearchFilters,
+) -> dict[str, Any]:
+    """\
+    Build the elasticsearch query for a beatmapset search.
+
+    Only the text query contributes to scoring; everything else is placed
+    in filter context, which elasticsearch can cache & reuse between queries.
+
+    Beatmap-level conditions must all be matched by the same beatmap.
+    """
+    must_conditions: list[dict[str, Any]] = []
+    beatmap_conditions: list[dict[str, Any]] = []
 
     if query is not None:
-        query_conditions.append(
+        must_conditions.append(
             {
                 "simple_query_string": {
                     "query": query,
@@ -81,16 +463,222 @@ async def search(
         )
 
     if mode != GameMode.ALL:
-        query_conditions.append({"term": {"data.beatmaps.mode_int": int(mode)}})
+        beatmap_conditions.append({"term": {"data.beatmaps.mode_int": int(mode)}})
 
     if status != OsuAPIRankedStatus.ALL:
-        query_conditions.append({"term": {"data.beatmaps.ranked": int(status)}})
+        beatmap_conditions.append({"term": {"data.beatmaps.ranked": int(status)}})
 
-    elastic_response = await services.elastic_client.search(
-        index=settings.BEATMAPSETS_INDEX,
-        query={"bool": {"must": query_conditions}},
-        size=amount,
-        from_=offset,
+    beatmap_conditions.extend(
+        _build_range_filters(filters, BEATMAP_RANGE_FILTER_FIELDS),
     )
 
-    return [hit["_source"]["data"] for hit in elastic_response["hits"]["hits"]]
+    filter_conditions = _build_range_filters(filters, BEATMAPSET_RANGE_FILTER_FIELDS)
+    if beatmap_conditions:
+        filter_conditions.append(
+            {
+                "nested": {
+                    "path": "data.beatmaps",
+                    "query": {"bool": {"filter": beatmap_conditions}},
+                },
+            },
+        )
+
+    return {"bool": {"must": must_conditions, "filter": filter_conditions}}
+
+
+def build_search_sort(query: str | None) -> list[dict[str, Any]]:
+    """\
+    Build the sort order for a beatmapset search.
+
+    Text searches are ordered by relevance, while browsing without a query
+    lists the newest beatmapsets first, as osu!direct does.
+    """
+    if query is not None:
+        # the beatmapset id breaks ties, so the order is stable between pages
+        return [{"_score": "desc"}, {"data.id": "asc"}]
+
+    # only ranked, qualified & loved beatmapsets have a ranked date
+    return [
+        {"data.ranked_date": {"order": "desc", "missing": "_last"}},
+        {"data.last_updated": "desc"},
+        {"data.id": "desc"},
+    ]
+
+
+async def _search(
+    query: str | None,
+    amount: int,
+    offset: int,
+    mode: int,
+    status: int,
+    cursor: str | None,
+    format: ResponseFormat,
+    filters: SearchFilters,
+) -> dict[str, Any]:
+    search_kwargs: dict[str, Any] = {
+        "query": build_search_query(query, mode, status, filters),
+        "sort": build_search_sort(query),
+        "size": amount,
+        "source_includes": SOURCE_INCLUDES[format],
+    }
+
+    if cursor is not None:
+        search_after, pit_id = decode_cursor(cursor)
+
+        # searches within a point in time are implicitly tiebroken by
+        # `_shard_doc`, whose value is included in the hits' sort values
+        sort_lengths = {len(search_kwargs["sort"])}
+        if settings.SEARCH_USE_POINT_IN_TIME and pit_id is not None:
+            sort_lengths.add(len(search_kwargs["sort"]) + 1)
+
+        if len(search_after) not in sort_lengths:
+            # the cursor is from a search with a different sort order
+            raise ValueError("Invalid search cursor")
+
+        search_kwargs["search_after"] = search_after
+
+        if settings.SEARCH_USE_POINT_IN_TIME:
+            # pin the rest of the pagination to a consistent view of the index
+            if pit_id is None:
+                pit_response = await services.elastic_client.open_point_in_time(
+                    index=settings.BEATMAPSETS_INDEX,
+                    keep_alive=SEARCH_POINT_IN_TIME_KEEP_ALIVE,
+                )
+                pit_id = pit_response["id"]
+
+            search_kwargs["pit"] = {
+                "id": pit_id,
+                "keep_alive": SEARCH_POINT_IN_TIME_KEEP_ALIVE,
+            }
+    else:
+        pit_id = None
+        search_kwargs["from_"] = offset
+
+    if "pit" not in search_kwargs:
+        search_kwargs["index"] = settings.BEATMAPSETS_INDEX
+
+    try:
+        elastic_response = await services.elastic_client.search(**search_kwargs)
+    except (elasticsearch.BadRequestError, elasticsearch.NotFoundError):
+        if cursor is None:
+            raise
+
+        # the cursor's values were rejected, or it's point in time expired
+        raise ValueError("Invalid or expired search cursor")
+
+    hits = elastic_response["hits"]["hits"]
+
+    next_cursor = None
+    if len(hits) == amount:
+        next_cursor = encode_cursor(
+            search_after=hits[-1]["sort"],
+            pit_id=elastic_response.get("pit_id", pit_id),
+        )
+
+    if format is ResponseFormat.OSU_DIRECT:
+        return {"rows": await _get_osu_direct_rows(hits), "cursor": next_cursor}
+
+    if format is ResponseFormat.COMPACT:
+        return {
+            "beatmapsets": [
+                get_compact_beatmapset(hit["_source"]["data"]) for hit in hits
+            ],
+            "cursor": next_cursor,
+        }
+
+    return {
+        "beatmapsets": [hit["_source"]["data"] for hit in hits],
+        "cursor": next_cursor,
+    }
+
+
+async def _get_osu_direct_rows(hits: list[dict[str, Any]]) -> list[str]:
+    rows = [hit["_source"].get("osu_direct") for hit in hits]
+
+    # documents indexed before rows were pre-rendered need to be rendered here
+    missing_ids = [hit["_id"] for hit, row in zip(hits, rows) if row is None]
+    if missing_ids:
+        elastic_response = await services.elastic_client.mget(
+            index=settings.BEATMAPSETS_INDEX,
+            ids=missing_ids,
+            source_includes=["data"],
+        )
+        rendered_rows = {
+            doc["_id"]: osu_direct_rows.format_row(
+                Beatmapset.from_osu_api(doc["_source"]["data"]),
+            )
+            for doc in elastic_response["docs"]
+            if doc["found"]
+        }
+        rows = [
+            row if row is not None else rendered_rows.get(hit["_id"], "")
+            for hit, row in zip(hits, rows)
+        ]
+
+    return rows
+
+
+async def suggest(prefix: str, amount: int) -> list[dict[str, Any]]:
+    """\
+    Suggest beatmapsets whose artist, title or creator begin with a prefix.
+
+    Only the beatmapsets' ids & display strings are returned.
+    """
+    prefix = " ".join(prefix.lower().split())
+
+    generation = await cache.get_search_generation()
+    cache_key = (generation, amount, prefix)
+
+    suggested_beatmapsets = suggest_cache.get(cache_key)
+    if suggested_beatmapsets is not None:
+        cache.CACHE_HITS.labels("beatmapset_suggestions", "memory").inc()
+        return suggested_beatmapsets
+
+    cache.CACHE_MISSES.labels("beatmapset_suggestions", "memory").inc()
+
+    try:
+        elastic_response = await services.elastic_client.options(
+            request_timeout=SUGGEST_REQUEST_TIMEOUT,
+        ).search(
+            index=settings.BEATMAPSETS_INDEX,
+            suggest={
+                "beatmapsets": {
+                    "prefix": prefix,
+                    "completion": {
+                        "field": "suggest",
+                        "size": amount,
+                        "skip_duplicates": True,
+                    },
+                },
+            },
+            source_includes=["data.id", "data.artist", "data.title", "data.creator"],
+            # we only want the suggestions, not any search hits
+            size=0,
+        )
+    except elasticsearch.ConnectionTimeout:
+        # better to suggest nothing than to hold up the client's typing
+        logger.warning("Timed out fetching beatmapset suggestions", prefix=prefix)
+        return []
+
+    suggested_beatmapsets = []
+    seen_ids = set()
+
+    for option in elastic_response["suggest"]["beatmapsets"][0]["options"]:
+        beatmapset_data = option["_source"]["data"]
+
+        # a beatmapset may match on more than one of it's inputs
+        if beatmapset_data["id"] in seen_ids:
+            continue
+
+        seen_ids.add(beatmapset_data["id"])
+        suggested_beatmapsets.append(
+            {
+                "id": beatmapset_data["id"],
+                "artist": beatmapset_data["artist"],
+                "title": beatmapset_data["title"],
+                "creator": beatmapset_data["creator"],
+            },
+        )
+
+    suggest_cache.set(cache_key, suggested_beatmapsets, ttl=SUGGEST_CACHE_TTL)
+    return suggested_beatmapsets
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from typing import Any
 from typing import Mapping
+from typing import Sequence
 
 from app.repositories import beatmaps
 
@@ -16,3 +17,17 @@ async def get_from_checksum(checksum: str) -> Mapping[str, Any] | None:
     """Fetch a beatmap from it's checksum."""
     beatmap = await beatmaps.get_from_checksum(checksum)
     return beatmap
+
+
+async def get_many_from_ids(ids: Sequence[int]) -> list[Mapping[str, Any] | None]:
+    """Fetch many beatmaps from their ids, in the order given."""
+    beatmaps_data = await beatmaps.get_many_from_ids(ids)
+    return beatmaps_data
+
+
+async def get_many_from_checksums(
+    checksums: Sequence[str],
+) -> list[Mapping[str, Any] | None]:
+    """Fetch many beatmaps from their checksums, in the order given."""
+    beatmaps_data = await beatmaps.get_many_from_checksums(checksums)
+    return beatmaps_data
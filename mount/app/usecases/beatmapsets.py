@@ -1,56 +1,346 @@
 from __future__ import annotations
 
+import asyncio
 import traceback
+from datetime import timedelta
 from typing import Any
+from typing import AsyncIterator
+from typing import Awaitable
+from typing import Callable
+from typing import NamedTuple
+from typing import Sequence
 
-import httpx
 from app.common import logger
 from app.common import services
+from app.common.mirrors import MirrorResponse
+from app.common.negative_cache import NegativeCache
+from app.common.singleflight import SingleFlight
+from app.common.singleflight import SINGLEFLIGHT_CALLS
+from app.common.singleflight import SINGLEFLIGHT_COALESCED
+from app.models.beatmaps import Beatmapset
+from app.models.response_formats import ResponseFormat
+from app.models.search_filters import SearchFilters
 from app.repositories import beatmapsets
 
+id_flights = SingleFlight("beatmapsets")
 
-async def get_from_id(id: int) -> dict[str, Any] | None:
+# ids which the osu!api doesn't know of
+missing_id_cache = NegativeCache("missing_beatmapsets")
+
+
+# background refreshes of stale beatmapsets
+refresh_flights = SingleFlight("beatmapset_refreshes")
+
+# beatmapsets whose last refresh failed, which aren't retried for a while
+failed_refresh_cache = NegativeCache(
+    "failed_beatmapset_refreshes",
+    ttl=timedelta(minutes=5),
+)
+
+# hold references to the refresh tasks, so they aren't garbage collected
+_refresh_tasks: set[asyncio.Task] = set()
+
+
+async def get_from_id(
+    id: int,
+    format: ResponseFormat = ResponseFormat.FULL,
+) -> dict[str, Any] | Beatmapset | None:
+    """\
+    Fetch a beatmapset from it's id.
+
+    Beatmapsets we already have are returned immediately, even when they're
+    stale (i.e. past their status' update interval), in which case they're
+    refreshed from the osu!api in the background (stale-while-revalidate).
+    """
+    entry = await beatmapsets.get_entry_from_id(id, format)
+    if entry is not None:
+        if not entry.fresh:
+            schedule_refresh(id)
+
+        return entry.data
+
+    # coalesce concurrent requests for the same beatmapset into a single fetch
+    data = await id_flights.do(id, lambda: _fetch_from_id(id))
+    if data is not None and format is ResponseFormat.COMPACT:
+        return Beatmapset.from_osu_api(data)
+
+    return data
+
+
+async def get_many_from_ids(ids: Sequence[int]) -> list[dict[str, Any] | None]:
+    """\
+    Fetch many beatmapsets from their ids, in the order given.
+
+    Beatmapsets we don't have are fetched from the osu!api, and
+    written into elasticsearch in a single bulk request.
+    """
+    beatmapsets_data = await beatmapsets.get_many_from_ids(ids)
+
+    # the osu!api has no bulk beatmapset endpoint, so these are fetched one-by-one
+    # NOTE: we already know elasticsearch doesn't have them
+    missing_ids = list(
+        dict.fromkeys(id for id, data in zip(ids, beatmapsets_data) if data is None),
+    )
+    fetched_beatmapsets = await asyncio.gather(
+        *(
+            id_flights.do(id, lambda id=id: _fetch_from_osu_api(id))
+            for id in missing_ids
+        ),
+    )
+    found_beatmapsets = dict(zip(missing_ids, fetched_beatmapsets))
+
+    new_beatmapsets = [data for data in fetched_beatmapsets if data is not None]
+    if new_beatmapsets:
+        await beatmapsets.create_many(new_beatmapsets)
+
+    return [
+        data if data is not None else found_beatmapsets[id]
+        for id, data in zip(ids, beatmapsets_data)
+    ]
+
+
+async def _fetch_from_id(id: int) -> dict[str, Any] | None:
     data = await beatmapsets.get_from_id(id)
     if data is None:
-        try:
-            osu_api_data = await services.osu_api_client.get_beatmapset(id)
-        except services.OsuAPIRequestError as exc:
-            if exc.status_code == 404:
-                return None
-            else:
-                raise
+        osu_api_data = await _fetch_from_osu_api(id)
+        if osu_api_data is None:
+            return None
 
         data = await beatmapsets.create(osu_api_data)
 
     return data
 
 
-async def get_osz2_from_id(id: int) -> bytes | None:
+async def _fetch_from_osu_api(id: int) -> dict[str, Any] | None:
+    if await missing_id_cache.contains(id):
+        return None
+
     try:
-        response = await services.http_client.get(f"https://kitsu.moe/api/d/{id}")
-    except httpx.HTTPStatusError as exc:
-        if exc.response.status_code == 404:
+        return await services.osu_api_client.get_beatmapset(id)
+    except services.OsuAPIRequestError as exc:
+        if exc.status_code == 404:
+            await missing_id_cache.add(id)
             return None
         else:
-            logger.error(
-                "Received unhandled status code while downloading osz2",
-                beatmapset_id=id,
-                status_code=exc.response.status_code,
-            )
-            return None
-    except httpx.RequestError as exc:
-        logger.error(
-            "Unhandled request error while downloading osz2",
-            beatmapset_id=id,
-            stacktrace=traceback.format_exc(),
+            raise
+
+
+def schedule_refresh(id: int) -> None:
+    """Refresh a beatmapset from the osu!api in the background."""
+    # concurrent refreshes for the same beatmapset are coalesced
+    task = asyncio.create_task(refresh_flights.do(id, lambda: _refresh(id)))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def _refresh(id: int) -> None:
+    # the beatmapset was deleted upstream, or recently failed to refresh
+    if await missing_id_cache.contains(id) or await failed_refresh_cache.contains(id):
+        return
+
+    # another worker may have refreshed the beatmapset while we were waiting
+    entry = await beatmapsets.get_entry_from_id(id)
+    if entry is not None and entry.fresh:
+        return
+
+    try:
+        osu_api_data = await services.osu_api_client.get_beatmapset(
+            id,
+            priority=services.OsuAPIRequestPriority.REFRESH,
+        )
+        await beatmapsets.create(osu_api_data)
+    except services.OsuAPIRequestError as exc:
+        if exc.status_code == 404:
+            # we keep serving what we have, but stop trying to refresh it
+            await missing_id_cache.add(id)
+        else:
+            await _record_refresh_failure(id)
+    except Exception:
+        await _record_refresh_failure(id)
+
+
+async def _record_refresh_failure(id: int) -> None:
+    # we'll try again on a request for it, once the failure is forgotten
+    logger.error(
+        "Failed to refresh stale beatmapset",
+        beatmapset_id=id,
+        stacktrace=traceback.format_exc(),
+    )
+    await failed_refresh_cache.add(id)
+
+
+# upstream response headers which are forwarded to the client
+OSZ_FORWARDED_HEADERS = ("Content-Length", "Content-Range", "Accept-Ranges")
+
+
+class OszStream(NamedTuple):
+    status_code: int
+    headers: dict[str, str]
+    content: AsyncIterator[bytes]
+
+    # must be called once the response is done with, whether or not the
+    # content was iterated (e.g. if the client disconnected before it began)
+    close: Callable[[], Awaitable[None]]
+
+
+# how long to wait for another request's download before starting our own
+OSZ_DOWNLOAD_WAIT_TIMEOUT = 60
+
+# beatmapset id -> the path of the cached file (or None if the download
+# failed), resolved once an in-flight download into the disk cache completes
+osz_downloads: dict[int, asyncio.Future[str | None]] = {}
+
+
+async def _get_osz2_cache_key(id: int) -> str:
+    # the files of updated beatmapsets are cached under new keys, and
+    # their outdated files are left for the disk cache to evict
+    beatmapset = await beatmapsets.get_from_id(id, ResponseFormat.COMPACT)
+    if not isinstance(beatmapset, Beatmapset) or beatmapset.last_updated is None:
+        return str(id)
+
+    return f"{id}:{beatmapset.last_updated}"
+
+
+async def get_cached_osz2_path(id: int) -> str | None:
+    """\
+    Fetch the path to a beatmapset's .osz file, if the current version of
+    it is in our disk cache.
+    """
+    return await services.osz_cache.get(await _get_osz2_cache_key(id))
+
+
+async def wait_for_osz2_download(id: int) -> str | None:
+    """\
+    Wait for an in-flight download of a beatmapset's .osz file to complete,
+    and fetch the path of the cached file if it was successful.
+    """
+    download = osz_downloads.get(id)
+    if download is None:
+        return None
+
+    SINGLEFLIGHT_COALESCED.labels("osz_downloads").inc()
+
+    try:
+        return await asyncio.wait_for(
+            asyncio.shield(download),
+            timeout=OSZ_DOWNLOAD_WAIT_TIMEOUT,
         )
+    except asyncio.TimeoutError:
+        # the download is very slow; only we give up on it, as the downloader
+        # always completes it (and others may have only just begun waiting)
         return None
 
-    data = await response.aread()
 
-    # TODO: cache this (unzipped) to disk
+def _complete_download(
+    id: int,
+    download: asyncio.Future[str | None] | None,
+    osz_path: str | None,
+) -> None:
+    if download is None:
+        return
 
-    return data
+    if osz_downloads.get(id) is download:
+        del osz_downloads[id]
+
+    if not download.done():
+        download.set_result(osz_path)
+
+
+async def _stream_into_cache(
+    id: int,
+    cache_key: str,
+    mirror_response: MirrorResponse,
+    download: asyncio.Future[str | None] | None,
+) -> AsyncIterator[bytes]:
+    response = mirror_response.response
+    osz_path = None
+
+    try:
+        async with services.osz_cache.writer(cache_key) as writer:
+            async for chunk in mirror_response.aiter_bytes():
+                await writer.write(chunk)
+                yield chunk
+
+            content_length = response.headers.get("Content-Length")
+            if content_length is not None and writer.size != int(content_length):
+                raise Exception("Upstream osz2 download was truncated")
+
+        osz_path = writer.file_path
+    finally:
+        _complete_download(id, download, osz_path)
+        await response.aclose()
+
+
+async def _stream(mirror_response: MirrorResponse) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in mirror_response.aiter_bytes():
+            yield chunk
+    finally:
+        await mirror_response.response.aclose()
+
+
+async def stream_osz2_from_id(
+    id: int,
+    range: str | None = None,
+    if_range: str | None = None,
+) -> OszStream | None:
+    """\
+    Begin streaming a beatmapset's .osz file from the best upstream mirror.
+
+    Complete downloads are written into our disk cache as they're streamed.
+    """
+    headers = {
+        # we forward the content length; make sure it's of the raw file
+        "Accept-Encoding": "identity",
+    }
+    if range is not None:
+        headers["Range"] = range
+        if if_range is not None:
+            headers["If-Range"] = if_range
+
+    cache_key = await _get_osz2_cache_key(id)
+
+    download: asyncio.Future[str | None] | None = None
+    if range is None and id not in osz_downloads:
+        # concurrent requests for this file will wait for our download
+        download = asyncio.get_running_loop().create_future()
+        osz_downloads[id] = download
+        SINGLEFLIGHT_CALLS.labels("osz_downloads").inc()
+
+    try:
+        # NOTE: errors from each mirror are logged & scored by the pool
+        mirror_response = await services.osz_mirrors.send(id, headers=headers)
+    except Exception:
+        _complete_download(id, download, None)
+        raise
+
+    if mirror_response is None:
+        _complete_download(id, download, None)
+        return None
+
+    response = mirror_response.response
+    if response.status_code == 200:
+        # the whole file is being sent; cache it as we go
+        content = _stream_into_cache(id, cache_key, mirror_response, download)
+    else:
+        _complete_download(id, download, None)
+        content = _stream(mirror_response)
+
+    async def close() -> None:
+        # waiters fall back to their own downloads if ours didn't complete
+        _complete_download(id, download, None)
+        await response.aclose()
+
+    return OszStream(
+        status_code=response.status_code,
+        headers={
+            header: response.headers[header]
+            for header in OSZ_FORWARDED_HEADERS
+            if header in response.headers
+        },
+        content=content,
+        close=close,
+    )
 
 
 async def search(
@@ -59,12 +349,23 @@ async def search(
     status: int,
     amount: int,
     offset: int,
-) -> list[dict[str, Any]]:
+    cursor: str | None = None,
+    format: ResponseFormat = ResponseFormat.FULL,
+    filters: SearchFilters = SearchFilters(),
+) -> dict[str, Any]:
     search_results = await beatmapsets.search(
         query=query,
         mode=mode,
         status=status,
         amount=amount,
         offset=offset,
+        cursor=cursor,
+        format=format,
+        filters=filters,
     )
     return search_results
+
+
+async def suggest(prefix: str, amount: int) -> list[dict[str, Any]]:
+    suggestions = await beatmapsets.suggest(prefix=prefix, amount=amount)
+    return suggestions
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3.10
+"""\
+Compare the memory use & decode/encode times of beatmapsets held as
+osu!api payload dicts against our slotted models, and the time taken to
+serve a compact lookup from each of the id caches. Models only pay for
+themselves in the long-lived id cache; searches are served as dicts.
+
+Usage: PYTHONPATH=mount python scripts/benchmark_models.py
+"""
+
+from __future__ import annotations
+
+import random
+import timeit
+import tracemalloc
+from typing import Any
+from typing import Callable
+
+import orjson
+from app.models.beatmaps import Beatmapset
+from app.models.beatmaps import get_compact_beatmapset
+
+BEATMAPSETS = 1000
+BEATMAPSETS_PER_PAGE = 100
+DIFFICULTIES_PER_BEATMAPSET = 8
+ITERATIONS = 200
+
+
+def make_beatmap(beatmapset_id: int, i: int) -> dict[str, Any]:
+    return {
+        "id": beatmapset_id * 100 + i,
+        "beatmapset_id": beatmapset_id,
+        "checksum": random.randbytes(16).hex(),
+        "version": f"Difficulty {i}",
+        "mode": "osu",
+        "mode_int": 0,
+        "status": "ranked",
+        "ranked": 1,
+        "difficulty_rating": random.uniform(0, 10),
+        "bpm": 180.0,
+        "total_length": 120,
+        "hit_length": 110,
+        "cs": 4.0,
+        "drain": 6.0,
+        "accuracy": 8.0,
+        "ar": 9.0,
+        "last_updated": "2022-01-01T00:00:00Z",
+        # fields of the osu!api payload which the mirror doesn't serve
+        "user_id": beatmapset_id,
+        "url": f"https://osu.ppy.sh/beatmaps/{beatmapset_id * 100 + i}",
+        "convert": False,
+        "is_scoreable": True,
+        "deleted_at": None,
+        "max_combo": random.randint(100, 2000),
+        "count_circles": random.randint(100, 1000),
+        "count_sliders": random.randint(100, 1000),
+        "count_spinners": random.randint(0, 5),
+        "passcount": random.randint(0, 100000),
+        "playcount": random.randint(0, 1000000),
+        "failtimes": {
+            "fail": [random.randint(0, 1000) for _ in range(100)],
+            "exit": [random.randint(0, 1000) for _ in range(100)],
+        },
+    }
+
+
+def make_beatmapset(id: int) -> dict[str, Any]:
+    return {
+        "id": id,
+        "user_id": id,
+        "artist": f"Artist {id}",
+        "artist_unicode": f"Artist {id}",
+        "title": f"Title {id}",
+        "title_unicode": f"Title {id}",
+        "creator": f"Creator {id}",
+        "source": "",
+        "status": "ranked",
+        "ranked": 1,
+        "bpm": 180.0,
+        "nsfw": False,
+        "video": False,
+        "ranked_date": "2022-01-01T00:00:00Z",
+        "submitted_date": "2022-01-01T00:00:00Z",
+        "last_updated": "2022-01-01T00:00:00Z",
+        # fields of the osu!api payload which the mirror doesn't serve
+        "covers": {
+            name: f"https://assets.ppy.sh/beatmaps/{id}/covers/{name}.jpg"
+            for name in ("cover", "card", "list", "slimcover")
+        },
+        "favourite_count": random.randint(0, 10000),
+        "play_count": random.randint(0, 1000000),
+        "preview_url": f"//b.ppy.sh/preview/{id}.mp3",
+        "spotlight": False,
+        "storyboard": False,
+        "tags": " ".join(f"tag{i}" for i in range(20)),
+        "availability": {"download_disabled": False, "more_information": None},
+        "can_be_hyped": False,
+        "discussion_enabled": True,
+        "is_scoreable": True,
+        "legacy_thread_url": f"https://osu.ppy.sh/community/forums/topics/{id}",
+        "nominations_summary": {"current": 2, "required": 2},
+        "ratings": [random.randint(0, 100) for _ in range(11)],
+        "beatmaps": [make_beatmap(id, i) for i in range(DIFFICULTIES_PER_BEATMAPSET)],
+    }
+
+
+def measure_memory(build: Callable[[], list[Any]]) -> int:
+    tracemalloc.start()
+    objects = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del objects
+    return size
+
+
+def main() -> int:
+    payloads = [orjson.dumps(make_beatmapset(id)) for id in range(BEATMAPSETS)]
+
+    full_size = measure_memory(lambda: [orjson.loads(p) for p in payloads])
+    compact_size = measure_memory(
+        lambda: [get_compact_beatmapset(orjson.loads(p)) for p in payloads],
+    )
+    model_size = measure_memory(
+        lambda: [Beatmapset.from_osu_api(orjson.loads(p)) for p in payloads],
+    )
+
+    print(f"full payload dicts:  {full_size / BEATMAPSETS:8.0f} bytes/beatmapset")
+    print(f"compact dicts:       {compact_size / BEATMAPSETS:8.0f} bytes/beatmapset")
+    print(f"models:              {model_size / BEATMAPSETS:8.0f} bytes/beatmapset")
+
+    # a page of compact search results, as fetched from elasticsearch (or the
+    # search cache); these are served once, so they're kept as dicts
+    page = [
+        orjson.dumps(get_compact_beatmapset(orjson.loads(p)))
+        for p in payloads[:BEATMAPSETS_PER_PAGE]
+    ]
+    compact_dicts = [orjson.loads(p) for p in page]
+    models = [Beatmapset.from_osu_api(orjson.loads(p)) for p in page]
+    assert orjson.dumps(compact_dicts) == orjson.dumps(models)
+
+    for name, function in (
+        ("decode page to dicts", lambda: [orjson.loads(p) for p in page]),
+        (
+            "decode page to models",
+            lambda: [Beatmapset.from_osu_api(orjson.loads(p)) for p in page],
+        ),
+        ("encode page of dicts", lambda: orjson.dumps(compact_dicts)),
+        ("encode page of models", lambda: orjson.dumps(models)),
+    ):
+        time_taken = timeit.timeit(function, number=ITERATIONS)
+        print(f"{name + ':':21}{time_taken / ITERATIONS * 1e6:8.1f}us/page")
+
+    # compact lookups were projected from the cached full payload on each
+    # request; they're now served from the cached model as it is
+    full_beatmapsets = [orjson.loads(p) for p in payloads[:BEATMAPSETS_PER_PAGE]]
+    for name, function in (
+        (
+            "from full payloads",
+            lambda: [
+                orjson.dumps(Beatmapset.from_osu_api(beatmapset))
+                for beatmapset in full_beatmapsets
+            ],
+        ),
+        ("from models", lambda: [orjson.dumps(model) for model in models]),
+    ):
+        time_taken = timeit.timeit(function, number=ITERATIONS)
+        print(
+            f"{'compact lookup ' + name + ':':37}"
+            f"{time_taken / ITERATIONS / BEATMAPSETS_PER_PAGE * 1e6:8.1f}"
+            "us/beatmapset",
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
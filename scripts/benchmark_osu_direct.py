@@ -0,0 +1,114 @@
+#!/usr/bin/env python3.10
+"""\
+Compare rendering osu!direct search responses on each request
+against joining the rows pre-rendered at indexing time.
+
+Usage: PYTHONPATH=mount python scripts/benchmark_osu_direct.py
+"""
+from __future__ import annotations
+
+import random
+import timeit
+from typing import Any
+from typing import Mapping
+from typing import Sequence
+
+from app.api import responses
+from app.common import osu_direct
+from app.models.beatmaps import Beatmapset
+
+BEATMAPSETS_PER_PAGE = 100
+DIFFICULTIES_PER_BEATMAPSET = 8
+ITERATIONS = 1000
+
+
+def make_beatmapset(id: int) -> dict[str, Any]:
+    return {
+        "id": id,
+        "user_id": id,
+        "artist": f"Artist {id}",
+        "artist_unicode": f"Artist {id}",
+        "title": f"Title {id}",
+        "title_unicode": f"Title {id}",
+        "creator": f"Creator {id}",
+        "source": "",
+        "status": "ranked",
+        "ranked": 1,
+        "bpm": 180,
+        "video": False,
+        "ranked_date": "2022-01-01T00:00:00+00:00",
+        "submitted_date": "2022-01-01T00:00:00+00:00",
+        "last_updated": "2022-01-01T00:00:00+00:00",
+        "beatmaps": [
+            {
+                "id": id * 100 + i,
+                "beatmapset_id": id,
+                "version": f"Difficulty {i}",
+                "mode": "osu",
+                "mode_int": 0,
+                "status": "ranked",
+                "ranked": 1,
+                "difficulty_rating": random.uniform(0, 10),
+                "total_length": 120,
+                "hit_length": 110,
+                "cs": 4,
+                "drain": 6,
+                "accuracy": 8,
+                "ar": 9,
+            }
+            for i in range(DIFFICULTIES_PER_BEATMAPSET)
+        ],
+    }
+
+
+def render_per_request(beatmapsets: Sequence[Mapping[str, Any]]) -> bytes:
+    # the renderer previously used by `responses.osu_direct`
+    resp_data = bytearray()
+    beatmapset_count = 0
+
+    for beatmapset_data in beatmapsets:
+        difficulties_string = ",".join(
+            [
+                (
+                    "[{difficulty_rating:.2f}⭐] {version} "
+                    "{{cs: {cs} / od: {accuracy} / ar: {ar} / hp: {drain}}}@{mode_int}"
+                ).format(**beatmap)
+                for beatmap in beatmapset_data["beatmaps"]
+            ],
+        )
+        beatmapset_string = (
+            "{id}.osz|{artist}|{title}|{creator}|"
+            "{ranked}|10.0|{last_updated}|{id}|"
+            "0|{video}|0|0|0|{difficulties_string}\n"
+        ).format(**beatmapset_data, difficulties_string=difficulties_string)
+
+        resp_data.extend(beatmapset_string.encode())
+        beatmapset_count += 1
+
+    return f"{beatmapset_count}\n".encode() + bytes(resp_data)
+
+
+def main() -> int:
+    beatmapsets = [make_beatmapset(id) for id in range(BEATMAPSETS_PER_PAGE)]
+    rows = [
+        osu_direct.format_row(Beatmapset.from_osu_api(beatmapset))
+        for beatmapset in beatmapsets
+    ]
+
+    per_request_time = timeit.timeit(
+        lambda: render_per_request(beatmapsets),
+        number=ITERATIONS,
+    )
+    pre_rendered_time = timeit.timeit(
+        lambda: responses.osu_direct(rows).body,
+        number=ITERATIONS,
+    )
+
+    print(f"rendered per request: {per_request_time / ITERATIONS * 1e6:.1f}us/page")
+    print(f"pre-rendered rows:    {pre_rendered_time / ITERATIONS * 1e6:.1f}us/page")
+    print(f"speedup:              {per_request_time / pre_rendered_time:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3.10
+"""\
+Check that search cursors round-trip, and that following the cursor of
+each page of a search continues exactly where an offset search would.
+
+Usage: PYTHONPATH=mount python scripts/check_search_pagination.py
+(requires elasticsearch to be running, with some beatmapsets indexed)
+"""
+from __future__ import annotations
+
+import asyncio
+
+from app.common import services
+from app.common import settings
+from app.models.gamemodes import GameMode
+from app.models.ranked_statuses import OsuAPIRankedStatus
+from app.models.response_formats import ResponseFormat
+from app.models.search_filters import SearchFilters
+from app.repositories import beatmapsets
+from elasticsearch import AsyncElasticsearch
+
+BEATMAPSETS_PER_PAGE = 10
+PAGES = 3
+
+
+def check_cursor_round_trip() -> None:
+    # scores are floats, dates are longs & ids are keywords (strings)
+    search_after = [12.5, 1640995200000, "1234"]
+    for pit_id in (None, "pit"):
+        cursor = beatmapsets.encode_cursor(search_after, pit_id)
+        assert beatmapsets.decode_cursor(cursor) == (search_after, pit_id)
+
+
+async def check_pagination(query: str | None) -> None:
+    search_kwargs = {
+        "query": query,
+        "mode": GameMode.OSU,
+        "status": OsuAPIRankedStatus.RANKED,
+        "format": ResponseFormat.FULL,
+        "filters": SearchFilters(),
+    }
+
+    expected_results = await beatmapsets._search(
+        amount=BEATMAPSETS_PER_PAGE * PAGES,
+        offset=0,
+        cursor=None,
+        **search_kwargs,
+    )
+    expected_ids = [beatmapset["id"] for beatmapset in expected_results["beatmapsets"]]
+
+    ids = []
+    cursor = None
+    for page in range(PAGES):
+        results = await beatmapsets._search(
+            amount=BEATMAPSETS_PER_PAGE,
+            offset=0,
+            cursor=cursor,
+            **search_kwargs,
+        )
+        ids.extend(beatmapset["id"] for beatmapset in results["beatmapsets"])
+
+        cursor = results["cursor"]
+        if cursor is None:
+            break
+
+    assert ids == expected_ids, (query, ids, expected_ids)
+    print(f"query={query!r}: followed cursors through {len(ids)} beatmapsets")
+
+
+async def main() -> int:
+    check_cursor_round_trip()
+
+    services.elastic_client = AsyncElasticsearch(
+        f"http://{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}",
+        basic_auth=(settings.ELASTIC_USER, settings.ELASTIC_PASS),
+    )
+    try:
+        await check_pagination(query=None)
+        await check_pagination(query="a")
+    finally:
+        await services.elastic_client.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
@@ -14,6 +14,10 @@ case $APP_COMPONENT in
         python -m app.workers.daemons.crawler
         ;;
 
+    "migrate")
+        python -m app.migrate_indices
+        ;;
+
     "api")
         exec uvicorn \
             --host 0.0.0.0 \